@@ -34,6 +34,9 @@ from alignak.external_command import ExternalCommand
 
 from alignak_backend_client.client import Backend, BackendException
 
+from alignak_module_backend.profiler import Profiler
+from alignak_module_backend.session import SessionPool
+
 # Set the backend client library log to ERROR level
 logging.getLogger("alignak_backend_client.client").setLevel(logging.ERROR)
 
@@ -112,7 +115,9 @@ class AlignakBackendArbiter(BaseModule):
 
         self.url = getattr(mod_conf, 'api_url', 'http://localhost:5000')
         logger.info("Alignak backend endpoint: %s", self.url)
-        self.backend = Backend(self.url, self.client_processes)
+        # HTTP connections pool of the backend client
+        self.http_pool = SessionPool(mod_conf, self.statsmgr)
+        self.backend = self.http_pool.attach(Backend(self.url, self.client_processes))
         self.backend.token = getattr(mod_conf, 'token', '')
         self.backend_connected = False
         self.backend_errors_count = 0
@@ -185,6 +190,9 @@ class AlignakBackendArbiter(BaseModule):
 
         self.alignak_configuration = {}
 
+        # On-demand profiling of the arbiter loop
+        self.profiler = Profiler(self.alias, mod_conf)
+
     # Common functions
     def do_loop_turn(self):
         """This function is called/used when you need a module with
@@ -1242,6 +1250,9 @@ class AlignakBackendArbiter(BaseModule):
         :type arbiter: object
         :return: None
         """
+        self.profiler.check()
+        self.http_pool.check()
+
         if not self.backend_connected:
             self.getToken()
             if self.raise_backend_alert(errors_count=10):
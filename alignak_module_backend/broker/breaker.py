@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the circuit breaker that protects the backend when it is not available
+
+- closed: the backend is available, the requests are sent
+- open: the backend failed, no request is sent until the retry delay elapsed
+- half-open: the retry delay elapsed, a single probe (the backend connection) is allowed.
+  If it succeeds, the circuit is closed, else it is opened again for a longer delay.
+
+The retry delay doubles after each failed probe, up to a maximum delay, and it is randomly
+shortened (jitter) so that several modules do not retry at the same time.
+"""
+
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+STATES = {
+    CLOSED: 'closed',
+    OPEN: 'open',
+    HALF_OPEN: 'half-open'
+}
+
+
+class CircuitBreaker(object):
+    """A circuit breaker with an exponential backoff
+
+    The failures are reported by several threads (eg. the sender workers)
+    """
+
+    def __init__(self, statsmgr, min_delay=1, max_delay=300, jitter=0.5):
+        """Circuit breaker initialization
+
+        :param statsmgr: the statistics manager
+        :type statsmgr: alignak.stats.Stats
+        :param min_delay: retry delay after the first failure (seconds)
+        :type min_delay: float
+        :param max_delay: maximum retry delay (seconds)
+        :type max_delay: float
+        :param jitter: part of the retry delay that is random (0 to 1)
+        :type jitter: float
+        """
+        self.statsmgr = statsmgr
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.jitter = min(1.0, max(0.0, jitter))
+
+        self.state = CLOSED
+        # Number of failures since the circuit was closed
+        self.failures = 0
+        self.retry_at = 0
+        self.lock = threading.Lock()
+
+    def set_state(self, state):
+        """Change the circuit state and send the state statistics
+
+        :param state: new state
+        :type state: int
+        :return: None
+        """
+        if state != self.state:
+            logger.info("backend circuit breaker: %s -> %s",
+                        STATES[self.state], STATES[state])
+        self.state = state
+        self.statsmgr.gauge('backend-breaker-state', state)
+
+    def get_delay(self):
+        """Get the retry delay after the current failures
+
+        :return: retry delay (seconds)
+        :rtype: float
+        """
+        delay = min(self.max_delay, self.min_delay * 2 ** min(self.failures - 1, 32))
+        return delay - delay * self.jitter * random.random()
+
+    def allow(self):
+        """Check if a request may be sent to the backend
+
+        When the circuit is open and its retry delay elapsed, the circuit is half-opened and
+        only the caller is allowed to send a probe request.
+
+        :return: True if the request may be sent
+        :rtype: bool
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() >= self.retry_at:
+                self.set_state(HALF_OPEN)
+                return True
+            return False
+
+    def success(self):
+        """Report a successful request, the circuit is closed
+
+        :return: None
+        """
+        with self.lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self.set_state(CLOSED)
+
+    def failure(self):
+        """Report a failed request, the circuit is opened
+
+        :return: None
+        """
+        with self.lock:
+            if self.state == OPEN:
+                # Other requests sent before the circuit was opened
+                return
+            self.failures += 1
+            delay = self.get_delay()
+            self.retry_at = time.time() + delay
+            self.statsmgr.counter('backend-breaker-open', 1)
+            logger.warning("backend not available (%d failures), retrying in %.1f seconds",
+                           self.failures, delay)
+            self.set_state(OPEN)
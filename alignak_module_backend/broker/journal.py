@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module is a write-ahead journal used by the broker module to keep the backend updates
+that are not yet sent to the alignak-backend
+
+The journal is a file of newline-delimited JSON records. A record is appended for each
+pending update; the records are written to the operating system on each `sync` and they are
+flushed to the disk (fsync) at most once per configured interval, so the disk cost does not
+depend on the updates rate. A module crash does not lose the synced records, a system crash
+may lose the records of the last fsync interval.
+
+Once the pending updates are sent to the backend (or spooled), the journal is truncated with
+`commit`. When the module starts, the records of the journal that were not committed are
+replayed; some updates may thus be sent twice (at least once delivery).
+"""
+
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class Journal(object):
+    """A write-ahead journal with batched fsync
+    """
+
+    def __init__(self, path, name='journal', fsync_interval=1.0):
+        """Journal initialization
+
+        The records of an existing journal file are loaded, they are returned by `read`.
+
+        :param path: journal directory, created if it does not exist
+        :type path: str
+        :param name: journal name, used for the journal file name
+        :type name: str
+        :param fsync_interval: minimum delay between two fsync (seconds), 0 to fsync on
+        each sync
+        :type fsync_interval: float
+        """
+        self.path = path
+        self.name = name
+        self.fsync_interval = fsync_interval
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.filename = os.path.join(self.path, '%s.journal' % self.name)
+
+        # Records not committed by the previous module run
+        self.records = []
+        if os.path.exists(self.filename):
+            with open(self.filename, 'rb') as journal:
+                for line in journal:
+                    try:
+                        self.records.append(json.loads(line.decode('utf-8')))
+                    except ValueError:
+                        # Partially written line, dropped
+                        logger.warning("Journal %s: ignoring a corrupted record", self.filename)
+            if self.records:
+                logger.info("Journal %s: %d records to replay", self.filename, len(self.records))
+
+        self.file = open(self.filename, 'ab')
+        # Records appended since the last commit / modifications not yet fsynced
+        self.count = 0
+        self.dirty = False
+        self.synced = time.time()
+        self.fsyncs = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def size(self):
+        """Get the current journal size
+
+        :return: size of the journal file (bytes)
+        :rtype: int
+        """
+        return os.path.getsize(self.filename)
+
+    def read(self):
+        """Get the records not committed by the previous module run
+
+        The records are returned only once.
+
+        :return: list of records
+        :rtype: list
+        """
+        records, self.records = self.records, []
+        return records
+
+    def append(self, record):
+        """Append a record to the journal
+
+        The record is buffered until the next `sync`.
+
+        :param record: JSON serializable record
+        :type record: list | dict
+        :return: None
+        """
+        self.file.write(json.dumps(record).encode('utf-8') + b'\n')
+        self.count += 1
+        self.dirty = True
+
+    def sync(self, force=False):
+        """Write the buffered records and fsync the journal if the fsync interval elapsed
+
+        :param force: fsync even if the fsync interval did not elapse
+        :type force: bool
+        :return: True if the journal was fsynced
+        :rtype: bool
+        """
+        if not self.dirty:
+            return False
+
+        self.file.flush()
+        if not force and time.time() - self.synced < self.fsync_interval:
+            return False
+
+        os.fsync(self.file.fileno())
+        self.synced = time.time()
+        self.dirty = False
+        self.fsyncs += 1
+        return True
+
+    def commit(self, records=None):
+        """Truncate the journal, its records were sent to the backend
+
+        The truncation is fsynced with the next records.
+
+        :param records: records still pending, written in the truncated journal
+        :type records: list
+        :return: None
+        """
+        self.file.flush()
+        self.file.seek(0)
+        self.file.truncate()
+        self.count = 0
+        self.dirty = True
+        for record in records or []:
+            self.append(record)
+
+    def close(self):
+        """Sync and close the journal
+
+        :return: None
+        """
+        if self.file.closed:
+            return
+        self.sync(force=True)
+        self.file.close()
+
+    def get_stats(self):
+        """Get the journal statistics
+
+        :return: dictionary with the journal records count, size and fsync count
+        :rtype: dict
+        """
+        return {
+            'records': self.count,
+            'size': self.size,
+            'fsyncs': self.fsyncs
+        }
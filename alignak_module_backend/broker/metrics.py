@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the latency histograms used to instrument the broker module
+
+A histogram counts the measured durations in fixed buckets whose bounds grow
+geometrically from 10 microseconds to about 2 minutes, so its memory size does not depend
+on the number of measures. The percentiles are the upper bounds of the buckets, thus
+their precision is the bucket width (25%).
+"""
+
+import time
+import bisect
+import threading
+
+# Buckets upper bounds (seconds)
+BUCKETS = [1e-5 * 1.25 ** index for index in range(74)]
+
+
+class Histogram(object):
+    """A latency histogram
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Count a measure
+
+        :param value: measured duration (seconds)
+        :type value: float
+        :return: None
+        """
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Get a percentile of the measures
+
+        :param percent: the percentile (eg. 99)
+        :type percent: float
+        :return: the percentile upper bound (seconds)
+        :rtype: float
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        cumulated = 0
+        for index, count in enumerate(self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return self.max  # pragma: no cover - should not happen
+
+    def get_stats(self):
+        """Get the histogram statistics
+
+        :return: dictionary with the measures count, mean, max, p50, p95 and p99 (seconds)
+        :rtype: dict
+        """
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+
+class Metrics(object):
+    """A set of named latency histograms
+
+    The histograms are updated by several threads (eg. the sender workers)
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, name, value):
+        """Count a measure in a named histogram
+
+        :param name: histogram name
+        :type name: str
+        :param value: measured duration (seconds)
+        :type value: float
+        :return: None
+        """
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def get_stats(self, reset=False):
+        """Get the statistics of all the histograms
+
+        :param reset: reset the histograms after getting their statistics
+        :type reset: bool
+        :return: dictionary with the statistics of each histogram
+        :rtype: dict
+        """
+        with self.lock:
+            stats = dict((name, histogram.get_stats())
+                         for name, histogram in self.histograms.items())
+            if reset:
+                self.histograms = {}
+                self.started = time.time()
+        return stats
+
+    def export(self, statsmgr):
+        """Send the histograms percentiles as timers and reset the histograms
+
+        :param statsmgr: the statistics manager
+        :type statsmgr: alignak.stats.Stats
+        :return: None
+        """
+        for name, stats in sorted(self.get_stats(reset=True).items()):
+            for key in ['p50', 'p95', 'p99']:
+                statsmgr.timer('latency.%s.%s' % (name, key), stats[key])
+            statsmgr.gauge('latency.%s.count' % name, stats['count'])
@@ -21,15 +21,32 @@
 This module is used to send logs and livestate to alignak-backend with broker
 """
 
+import os
 import time
 import json
+import zlib
 import queue
+import signal
 import logging
+from datetime import datetime
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 
 from alignak.stats import Stats
 from alignak.basemodule import BaseModule
 from alignak_backend_client.client import Backend, BackendException
 
+from alignak_module_backend.profiler import Profiler
+from alignak_module_backend.compression import BodyCompression
+from alignak_module_backend.session import SessionPool
+from alignak_module_backend.broker.spool import Spool
+from alignak_module_backend.broker.journal import Journal
+from alignak_module_backend.broker.metrics import Metrics
+from alignak_module_backend.broker.breaker import CircuitBreaker
+from alignak_module_backend.broker.references import LiveRef, intern_string, \
+    get_references_size
+
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 for handler in logger.parent.handlers:
     if isinstance(handler, logging.StreamHandler):
@@ -42,6 +59,17 @@ properties = {
     'external': True,
 }
 
+# Backend items fields compared with the status broks data when the status items cache is used
+STATUS_FIELDS = {
+    'host': ['active_checks_enabled', 'passive_checks_enabled', 'event_handler_enabled',
+             'flap_detection_enabled', 'check_freshness', 'freshness_threshold',
+             'notifications_enabled', 'process_perf_data', 'check_interval', 'retry_interval',
+             'max_check_attempts', 'notification_interval', 'first_notification_delay',
+             'customs'],
+    'user': ['host_notifications_enabled', 'service_notifications_enabled', 'customs']
+}
+STATUS_FIELDS['service'] = STATUS_FIELDS['host']
+
 
 def get_instance(mod_conf):
     """
@@ -55,7 +83,27 @@ def get_instance(mod_conf):
     return AlignakBackendBroker(mod_conf)
 
 
+def get_status_projection(endpoint, projection='{}'):
+    """Get the projection of the backend items kept in the status items cache
+
+    Only the item name and the fields compared with the status broks data are cached.
+
+    :param endpoint: backend endpoint (host | service | user)
+    :type endpoint: str
+    :param projection: projection of the other fields to get
+    :type projection: str
+    :return: the backend request projection
+    :rtype: str
+    """
+    fields = json.loads(projection)
+    fields['name'] = 1
+    for field in STATUS_FIELDS[endpoint]:
+        fields[field] = 1
+    return json.dumps(fields, sort_keys=True)
+
+
 class AlignakBackendBroker(BaseModule):
+    # pylint: disable=too-many-public-methods
     """ This class is used to send logs and livestate to alignak-backend
     """
 
@@ -98,15 +146,20 @@ class AlignakBackendBroker(BaseModule):
         self.url = getattr(mod_conf, 'api_url', 'http://localhost:5000')
         logger.info("Alignak backend endpoint: %s", self.url)
         self.backend_connected = False
-        self.backend_connection_retry_planned = 0
         try:
             self.backend_connection_retry_delay = int(getattr(mod_conf,
                                                               'backend_connection_retry_delay',
                                                               '10'))
         except ValueError:
             self.backend_connection_retry_delay = 10
-        logger.info("backend connection retry delay: %.2f seconds",
-                    self.backend_connection_retry_delay)
+        self.backend_connection_retry_max_delay = int(
+            getattr(mod_conf, 'backend_connection_retry_max_delay', '300'))
+        logger.info("backend connection retry delay: %.2f seconds, up to %.2f seconds",
+                    self.backend_connection_retry_delay, self.backend_connection_retry_max_delay)
+        # Circuit breaker shared by all the backend requests
+        self.breaker = CircuitBreaker(self.statsmgr,
+                                      min_delay=max(1, self.backend_connection_retry_delay),
+                                      max_delay=self.backend_connection_retry_max_delay)
 
         self.backend_errors_count = 0
         self.backend_username = getattr(mod_conf, 'username', '')
@@ -117,11 +170,54 @@ class AlignakBackendBroker(BaseModule):
         logger.info("backend pagination count: %d items", self.backend_count)
 
         self.backend_token = getattr(mod_conf, 'token', '')
-        self.backend = Backend(self.url, self.client_processes)
+        # Latency histograms
+        self.metrics = Metrics()
+        self.metrics_interval = int(getattr(mod_conf, 'metrics_interval', '60'))
+        self.metrics_exported = time.time()
+        self.metrics_dump_file = getattr(mod_conf, 'metrics_dump_file', '')
+        self.metrics_dump_requested = False
+
+        # On-demand profiling of the module main loop
+        self.profiler = Profiler(self.alias, mod_conf)
+
+        # Log check results request bodies compression
+        self.compression = BodyCompression(mod_conf, self.statsmgr, self.metrics)
+
+        # Live states sender workers
+        try:
+            self.sender_workers = max(1, int(getattr(mod_conf, 'sender_workers', '1')))
+        except ValueError:
+            self.sender_workers = 1
+        logger.info("live states sender workers: %d", self.sender_workers)
+
+        # Log check results posting
+        try:
+            self.lcr_workers = max(1, int(getattr(mod_conf, 'lcr_workers', '1')))
+        except ValueError:
+            self.lcr_workers = 1
+        self.lcr_batch_count = max(1, int(getattr(mod_conf, 'lcr_batch_count', '100')))
+        self.lcr_batch_size = int(getattr(mod_conf, 'lcr_batch_size', '0')) * 1024
+        logger.info("log check results posting: %d workers, batches of %d items / %d bytes",
+                    self.lcr_workers, self.lcr_batch_count, self.lcr_batch_size)
+
+        # HTTP connections pool shared by the module backend client and the sender workers
+        self.http_pool = SessionPool(mod_conf, self.statsmgr,
+                                     max(self.sender_workers, self.lcr_workers) + 1)
+        self.backend = self.get_backend()
+
+        self.sender_pool = None
+        self.sender_backends = []
 
         self.manage_update_program_status = getattr(mod_conf, 'update_program_status', '0') == '1'
         logger.info("manage update_program_status broks: %s", self.manage_update_program_status)
 
+        # Last known alignak items, per alignak name
+        self.alignak_items = {}
+        self.alignak_updated = {}
+        # Minimum delay between two updates when only the running properties changed
+        self.program_status_heartbeat = int(getattr(mod_conf, 'program_status_heartbeat', '0'))
+        self.program_status_running = ['last_alive', 'last_command_check', 'last_log_rotation']
+
         # Log in to the backend
         self.logged_in = False
         self.backend_connected = self.backend_connection()
@@ -140,13 +236,180 @@ class AlignakBackendBroker(BaseModule):
             'user': {}
         }
 
+        # Actions authors not found in the users references: author name -> user _id
+        self.authors_cache = OrderedDict()
+        self.authors_cache_size = int(getattr(mod_conf, 'authors_cache_size', '1000'))
+        self.admin_user_id = None
+
+        # Last known backend items used to compute the status differences
+        self.status_cache = getattr(mod_conf, 'status_cache', '0') == '1'
+        logger.info("status items cache: %s", self.status_cache)
+        self.items_cache = {
+            'host': {},
+            'service': {},
+            'user': {}
+        }
+
         # Objects reference
         self.load_protect_delay = int(getattr(mod_conf, 'load_protect_delay', '300'))
         self.last_load = 0
+        self.incremental_refs = getattr(mod_conf, 'incremental_refs', '0') == '1'
+        logger.info("incremental references loading: %s", self.incremental_refs)
+        self.backend_date_format = "%a, %d %b %Y %H:%M:%S GMT"
+        self.refs_loaded_time = None
+        # Backend items not referenced (services of an unknown host): endpoint -> set of _id
+        self.refs_ignored = {
+            'host': set(),
+            'service': set(),
+            'user': set()
+        }
+        # Hosts of the other shards (_id -> name), needed to name their updated services
+        self.other_shards_hosts = {}
+
+        # Broks handlers: brok type -> (handler, concerned object must be known)
+        self.brok_handlers = {}
+        self.register_brok_handler('new_conf', lambda brok: self.get_refs())
+        if self.manage_update_program_status:
+            self.register_brok_handler('program_status', self.update_program_status)
+            self.register_brok_handler('update_program_status', self.update_program_status)
+        self.register_brok_handler('host_next_schedule',
+                                   lambda brok: self.update_next_check(brok.data, 'host'),
+                                   True, True)
+        self.register_brok_handler('service_next_schedule',
+                                   lambda brok: self.update_next_check(brok.data, 'service'),
+                                   True, True)
+        for brok_type in ['update_host_status', 'update_service_status',
+                          'update_contact_status']:
+            self.register_brok_handler(brok_type, self.update_status, True)
+        for brok_type in ['host_check_result', 'service_check_result']:
+            self.register_brok_handler(brok_type, lambda brok: self.check_result(brok.data),
+                                       True, True)
+        for brok_type in ['acknowledge_raise', 'acknowledge_expire',
+                          'downtime_raise', 'downtime_expire']:
+            self.register_brok_handler(brok_type, self.update_actions)
+
+        # Queue messages batching
+        self.queue_timeout = float(getattr(mod_conf, 'queue_timeout', '1'))
+        self.batch_max_messages = max(1, int(getattr(mod_conf, 'batch_max_messages', '10')))
+        logger.info("queue timeout: %.2f seconds, batch max messages: %d",
+                    self.queue_timeout, self.batch_max_messages)
+
+        # Queue load shedding
+        self.queue_high_water = int(getattr(mod_conf, 'queue_high_water', '0'))
+        self.queue_max_age = int(getattr(mod_conf, 'queue_max_age', '0'))
+        self.shed_broks = [brok_type.strip() for brok_type in getattr(
+            mod_conf, 'shed_broks',
+            'host_next_schedule,service_next_schedule').split(',') if brok_type.strip()]
+        self.shed_broks_critical = [brok_type.strip() for brok_type in getattr(
+            mod_conf, 'shed_broks_critical',
+            'update_host_status,update_service_status,update_contact_status,'
+            'update_program_status').split(',') if brok_type.strip()]
+        self.shed_counts = {}
+        logger.info("queue high water mark: %d messages, max age: %d seconds",
+                    self.queue_high_water, self.queue_max_age)
+
+        # Broks filtering
+        broks_allow = [brok_type.strip()
+                       for brok_type in getattr(mod_conf, 'broks_allow', '').split(',')
+                       if brok_type.strip()]
+        broks_deny = [brok_type.strip()
+                      for brok_type in getattr(mod_conf, 'broks_deny', '').split(',')
+                      if brok_type.strip()]
+        for brok_type in list(self.brok_handlers):
+            if (broks_allow and brok_type not in broks_allow) or brok_type in broks_deny:
+                del self.brok_handlers[brok_type]
+        logger.info("managed broks: %s", sorted(self.brok_handlers))
+
+        # Broks sampling: brok type -> minimum delay between two broks for the same object
+        self.broks_sampling = {}
+        for sampling in getattr(mod_conf, 'broks_sampling', '').split(','):
+            if not sampling.strip():
+                continue
+            try:
+                brok_type, delay = sampling.split(':')
+                brok_type = brok_type.strip()
+                delay = int(delay)
+            except ValueError:
+                logger.warning("Invalid broks sampling configuration: %s", sampling)
+                continue
+            if brok_type in self.brok_handlers and not self.brok_handlers[brok_type][1]:
+                # The broks are sampled per concerned object
+                logger.warning("The %s broks do not concern an host, a service or a contact, "
+                               "they cannot be sampled", brok_type)
+                continue
+            self.broks_sampling[brok_type] = delay
+        logger.info("broks sampling: %s", self.broks_sampling)
+        self.broks_sampled = dict((brok_type, {}) for brok_type in self.broks_sampling)
+
+        # Shards: worker processes that manage the broks of a part of the hosts
+        self.shards = max(1, int(getattr(mod_conf, 'shards', '1')))
+        logger.info("broks management shards: %d", self.shards)
+        # Shard index of a worker process, None for the module process
+        self.shard = None
+        self.shard_parent = None
+        self.shard_queues = []
+        self.shard_processes = []
 
         # Backend to be posted data
         self.logcheckresults = []
 
+        # Log check results spool used when the backend is not available
+        self.spool = None
+        self.spool_dir = getattr(mod_conf, 'spool_dir', '')
+        self.spool_segment_size = int(getattr(mod_conf, 'spool_segment_size', '1024')) * 1024
+        self.spool_max_size = int(getattr(mod_conf, 'spool_max_size', '100')) * 1024 * 1024
+        # With several shards, each shard has its own spool (see `shard_main`)
+        if self.spool_dir and self.shards == 1:
+            self.spool = Spool(self.spool_dir, 'lcr', segment_size=self.spool_segment_size,
+                               max_size=self.spool_max_size)
+        self.spool_drain_count = int(getattr(mod_conf, 'spool_drain_count', '5000'))
+        self.spool_drain_interval = float(getattr(mod_conf, 'spool_drain_interval', '1'))
+        self.spool_drained = 0
+        logger.info("log check results spool: %s, drained by %d items every %.2f seconds",
+                    self.spool_dir or 'disabled', self.spool_drain_count,
+                    self.spool_drain_interval)
+        # Backend to be patched live states, coalesced per object
+        self.livestates = {
+            'host': {},
+            'service': {}
+        }
+        # Last live state values sent to the backend, per object: item _id -> {field: value}
+        self.livestate_cache = getattr(mod_conf, 'livestate_cache', '1') == '1'
+        logger.info("live states cache: %s", self.livestate_cache)
+        self.livestates_sent = {
+            'host': {},
+            'service': {}
+        }
+
+        # Bulk next checks updates: name -> next check, sent to a dedicated backend endpoint
+        self.next_check_bulk_endpoint = getattr(mod_conf, 'next_check_bulk_endpoint', '')
+        self.next_check_bulk_size = max(1, int(getattr(mod_conf, 'next_check_bulk_size',
+                                                       '1000')))
+        self.next_check_bulk_interval = int(getattr(mod_conf, 'next_check_bulk_interval', '0'))
+        logger.info("bulk next checks updates: %s, batches of %d items, every %d seconds",
+                    self.next_check_bulk_endpoint or 'disabled', self.next_check_bulk_size,
+                    self.next_check_bulk_interval)
+        self.next_checks = {
+            'host': {},
+            'service': {}
+        }
+        self.next_checks_flushed = 0
+
+        # Write-ahead journal of the pending log check results and live states updates
+        # With several shards, each shard has its own journal (see `shard_main`)
+        self.journal = None
+        self.journal_dir = getattr(mod_conf, 'journal_dir', '')
+        self.journal_fsync_interval = float(getattr(mod_conf, 'journal_fsync_interval', '1'))
+        if self.journal_dir and self.shards == 1:
+            self.journal = Journal(self.journal_dir, 'broker', self.journal_fsync_interval)
+        # Maximum number of journaled log check results kept pending when no spool exists
+        self.journal_max_lcrs = int(getattr(mod_conf, 'journal_max_lcrs', '10000'))
+        logger.info("pending updates journal: %s, fsync every %.2f seconds, "
+                    "up to %d pending LCRs", self.journal_dir or 'disabled',
+                    self.journal_fsync_interval, self.journal_max_lcrs)
+        # Journaled live states updates replayed when the objects references are loaded
+        self.journal_livestates = []
+
     # Common functions
     def do_loop_turn(self):
         """This function is called/used when you need a module with
@@ -171,9 +434,33 @@ class AlignakBackendBroker(BaseModule):
 
         return False
 
+    def check_backend_connection(self):
+        """Connect to the backend if the connection is not available
+
+        The connection is tried only if the circuit breaker allows a probe request, thus the
+        backend is not flooded with login requests while it is not available.
+
+        :return: True if the backend connection is available
+        :rtype: bool
+        """
+        if not self.backend_connected and self.breaker.allow():
+            self.backend_connected = self.backend_connection()
+
+        return self.backend_connected
+
+    def backend_failure(self):
+        """A backend request failed, the backend connection is not available anymore
+
+        :return: None
+        """
+        self.backend_connected = False
+        self.breaker.failure()
+
     def backend_connection(self):
         """Backend connection to check live state update is allowed
 
+        The result is reported to the circuit breaker.
+
         :return: True/False
         """
         if self.backend_login():
@@ -191,11 +478,16 @@ class AlignakBackendBroker(BaseModule):
                 try:
                     for item in users['_items']:
                         self.logged_in = item['can_update_livestate']
+                    if self.logged_in:
+                        self.breaker.success()
+                    else:
+                        self.breaker.failure()
                     return self.logged_in
                 except Exception as exp:
                     logger.error("Can't get the user information in the backend response: %s", exp)
 
         logger.error("Configured user account is not allowed for this module")
+        self.breaker.failure()
         return False
 
     def backend_login(self):
@@ -253,16 +545,19 @@ class AlignakBackendBroker(BaseModule):
         return default_realm
 
     def get_refs(self):
+        # pylint: disable=too-many-locals
         """
         Get the _id in the backend for hosts, services and users
 
+        If the incremental references loading is enabled and the references were already
+        loaded, only the items updated in the backend since the last loading are got, and the
+        deleted items are removed from the references.
+
         :return: None
         """
         start = time.time()
         now = int(time.time())
 
-        logger.info("Got a new configuration, reloading objects...")
-
         # Get managed inter-process dicts
         host_mapping = self.mapping['host']
         serv_mapping = self.mapping['service']
@@ -271,76 +566,151 @@ class AlignakBackendBroker(BaseModule):
         serv_ref_live = self.ref_live['service']
         user_ref_live = self.ref_live['user']
 
-        if now - self.last_load > self.load_protect_delay:
-            logger.info("Got a new configuration, reloading objects...")
+        incremental = self.incremental_refs and self.refs_loaded_time is not None
+        if incremental or now - self.last_load > self.load_protect_delay:
+            logger.info("Got a new configuration, reloading objects%s...",
+                        " updated since %s" % self.refs_loaded_time if incremental else '')
+            loaded_time = datetime.utcnow().strftime(self.backend_date_format)
+            where = {"_is_template": False}
+            if incremental:
+                where['_updated'] = {"$gte": self.refs_loaded_time}
+            else:
+                self.items_cache = {
+                    'host': {},
+                    'service': {},
+                    'user': {}
+                }
+                self.refs_ignored = {
+                    'host': set(),
+                    'service': set(),
+                    'user': set()
+                }
+                self.other_shards_hosts = {}
+
             # Updating hosts
             hosts = {}
+            if incremental:
+                hosts = dict((host_id, host_name) for host_name, host_id in host_mapping.items())
+                hosts.update(self.other_shards_hosts)
             params = {
                 'projection': '{"name":1,"ls_state":1,"ls_state_type":1,"_realm":1}',
                 'max_results': self.backend_count,
-                'where': '{"_is_template":false}'
+                'where': json.dumps(where)
             }
+            if self.status_cache:
+                # Also get the status fields to fill the items cache
+                params['projection'] = get_status_projection('host', params['projection'])
             content = self.backend.get_all('host', params)
             self.statsmgr.counter('backend-getall.host', 1)
+            renamed_hosts = {}
             for item in content['_items']:
-                host_mapping[item['name']] = item['_id']
-
-                host_ref_live[item['_id']] = {
-                    '_id': item['_id'],
-                    '_etag': item['_etag'],
-                    '_realm': item['_realm'],
-                    'initial_state': item['ls_state'],
-                    'initial_state_type': item['ls_state_type']
-                }
+                if item['_id'] in hosts and hosts[item['_id']] != item['name']:
+                    renamed_hosts[hosts[item['_id']]] = item['name']
+                    host_mapping.pop(hosts[item['_id']], None)
+                if not self.in_shard(item['name']):
+                    hosts[item['_id']] = item['name']
+                    self.other_shards_hosts[item['_id']] = item['name']
+                    host_ref_live.pop(item['_id'], None)
+                    continue
+                self.other_shards_hosts.pop(item['_id'], None)
+                host_ref_live[item['_id']] = LiveRef(item['_id'], item['_etag'], item['_realm'],
+                                                     item['ls_state'], item['ls_state_type'])
+                host_mapping[intern_string(item['name'])] = host_ref_live[item['_id']]['_id']
                 hosts[item['_id']] = item['name']
-            logger.info("- hosts references reloaded")
+                if self.status_cache:
+                    item.pop('_links', None)
+                    self.items_cache['host'][item['_id']] = item
+            logger.info("- hosts references reloaded (%d)", len(content['_items']))
+
+            # Renamed hosts services
+            for old_name, new_name in renamed_hosts.items():
+                for service_name in [service_name for service_name in serv_mapping
+                                     if service_name.startswith(old_name + '__')]:
+                    serv_mapping[new_name + service_name[len(old_name):]] = \
+                        serv_mapping.pop(service_name)
 
             # Updating services
+            services = {}
+            if incremental:
+                services = dict((service_id, service_name)
+                                for service_name, service_id in serv_mapping.items())
             params = {
                 'projection': '{"host":1,"name":1,"ls_state":1,"ls_state_type":1,"_realm":1}',
                 'max_results': self.backend_count,
-                'where': '{"_is_template":false}'
+                'where': json.dumps(where)
             }
+            if self.status_cache:
+                # Also get the status fields to fill the items cache
+                params['projection'] = get_status_projection('service', params['projection'])
             content = self.backend.get_all('service', params)
             self.statsmgr.counter('backend-getall.service', 1)
             for item in content['_items']:
                 try:
-                    serv_mapping['__'.join([hosts[item['host']], item['name']])] = item['_id']
-
-                    serv_ref_live[item['_id']] = {
-                        '_id': item['_id'],
-                        '_etag': item['_etag'],
-                        '_realm': item['_realm'],
-                        'initial_state': item['ls_state'],
-                        'initial_state_type': item['ls_state_type']
-                    }
+                    service_name = '__'.join([hosts[item['host']], item['name']])
+                    if item['_id'] in services:
+                        serv_mapping.pop(services[item['_id']], None)
+                    if not self.in_shard(hosts[item['host']]):
+                        serv_ref_live.pop(item['_id'], None)
+                        continue
+                    serv_ref_live[item['_id']] = LiveRef(item['_id'], item['_etag'],
+                                                         item['_realm'], item['ls_state'],
+                                                         item['ls_state_type'])
+                    serv_mapping[service_name] = serv_ref_live[item['_id']]['_id']
+                    self.refs_ignored['service'].discard(item['_id'])
+                    if self.status_cache:
+                        item.pop('_links', None)
+                        self.items_cache['service'][item['_id']] = item
                 except KeyError:
                     logger.warning("Got a service for an unknown host")
-            logger.info("- services references reloaded")
+                    self.refs_ignored['service'].add(item['_id'])
+            logger.info("- services references reloaded (%d)", len(content['_items']))
 
             # Updating users
+            users = {}
+            if incremental:
+                users = dict((user_id, user_name) for user_name, user_id in user_mapping.items())
             params = {
                 'projection': '{"name":1,"_realm":1}',
                 'max_results': self.backend_count,
-                'where': '{"_is_template":false}'
+                'where': json.dumps(where)
             }
+            if self.status_cache:
+                # Also get the status fields to fill the items cache
+                params['projection'] = get_status_projection('user', params['projection'])
             content = self.backend.get_all('user', params)
             self.statsmgr.counter('backend-getall.user', 1)
             for item in content['_items']:
-                user_mapping[item['name']] = item['_id']
-
-                user_ref_live[item['_id']] = {
-                    '_id': item['_id'],
-                    '_etag': item['_etag'],
-                    '_realm': item['_realm']
-                }
-            logger.info("- users references reloaded")
+                if item['_id'] in users:
+                    user_mapping.pop(users[item['_id']], None)
+                user_ref_live[item['_id']] = LiveRef(item['_id'], item['_etag'], item['_realm'])
+                user_mapping[intern_string(item['name'])] = user_ref_live[item['_id']]['_id']
+                if self.status_cache:
+                    item.pop('_links', None)
+                    self.items_cache['user'][item['_id']] = item
+            logger.info("- users references reloaded (%d)", len(content['_items']))
+
+            if incremental:
+                # Remove the items deleted in the backend
+                self.remove_deleted_refs('host', host_mapping, host_ref_live)
+                self.remove_deleted_refs('service', serv_mapping, serv_ref_live)
+                self.remove_deleted_refs('user', user_mapping, user_ref_live)
 
             self.last_load = now
+            self.refs_loaded_time = loaded_time
         else:
             logger.warning("- references not reloaded. Last reload is too recent; "
                            "set the 'load_protect_delay' parameter accordingly.")
 
+        # The live states may have been modified in the backend
+        self.livestates_sent = {
+            'host': {},
+            'service': {}
+        }
+
+        # The users may have changed
+        self.authors_cache.clear()
+        self.admin_user_id = None
+
         # Propagate changes in the inter-process dicts
         self.mapping['host'] = host_mapping
         self.mapping['service'] = serv_mapping
@@ -352,8 +722,64 @@ class AlignakBackendBroker(BaseModule):
         end = time.time()
         self.statsmgr.timer('backend-getall.time', end - start)
 
+        for endpoint in ['host', 'service', 'user']:
+            self.statsmgr.gauge('references-count.%s' % endpoint, len(self.ref_live[endpoint]))
+        self.statsmgr.gauge('references-memory', get_references_size(self.mapping, self.ref_live))
+
+        if self.journal_livestates:
+            self.replay_journal_livestates()
+
         return True
 
+    def remove_deleted_refs(self, endpoint, mapping, ref_live):
+        """Remove the references of the items deleted in the backend
+
+        The backend items count is compared to the count of the received items (the references
+        and the ignored items), and the backend items identifiers are got only if they are
+        different. A shard process only references a part of the items, thus it always gets the
+        backend items identifiers.
+
+        :param endpoint: backend endpoint (host | service | user)
+        :type endpoint: str
+        :param mapping: the endpoint items mapping
+        :type mapping: dict
+        :param ref_live: the endpoint items references
+        :type ref_live: dict
+        :return: number of removed references
+        :rtype: int
+        """
+        params = {
+            'projection': '{"_id":1}',
+            'max_results': 1,
+            'where': '{"_is_template":false}'
+        }
+        if self.shard is None:
+            result = self.backend.get(endpoint, params)
+            self.statsmgr.counter('backend-get.%s' % endpoint, 1)
+            if result['_meta']['total'] == len(ref_live) + len(self.refs_ignored[endpoint]):
+                return 0
+
+        params['max_results'] = self.backend_count
+        content = self.backend.get_all(endpoint, params)
+        self.statsmgr.counter('backend-getall.%s' % endpoint, 1)
+        existing = set(item['_id'] for item in content['_items'])
+        self.refs_ignored[endpoint] &= existing
+        if endpoint == 'host':
+            for item_id in set(self.other_shards_hosts) - existing:
+                del self.other_shards_hosts[item_id]
+        deleted = set(ref_live) - existing
+        if not deleted:
+            return 0
+
+        for name in [name for name in mapping if mapping[name] in deleted]:
+            del mapping[name]
+        for item_id in deleted:
+            del ref_live[item_id]
+            self.items_cache[endpoint].pop(item_id, None)
+        logger.info("- %d %s references removed", len(deleted), endpoint)
+
+        return len(deleted)
+
     def update_next_check(self, data, obj_type):
         """Update livestate host and service next check timestamp
 
@@ -371,26 +797,90 @@ class AlignakBackendBroker(BaseModule):
 
         if obj_type == 'host':
             if data['host_name'] in self.mapping['host']:
+                if self.next_check_bulk_endpoint:
+                    # Sent later with the other next checks
+                    self.next_checks['host'][data['host_name']] = data['next_chk']
+                    return True
+
                 # Received data for an host:
                 data_to_update = {
                     'ls_next_check': data['next_chk']
                 }
 
                 # Update live state
-                return self.send_to_backend('livestate_host', data['host_name'], data_to_update)
+                return self.update_livestate('host', data['host_name'], data_to_update)
         elif obj_type == 'service':
             service_name = '__'.join([data['host_name'], data['service_description']])
             if service_name in self.mapping['service']:
+                if self.next_check_bulk_endpoint:
+                    # Sent later with the other next checks
+                    self.next_checks['service'][service_name] = data['next_chk']
+                    return True
+
                 # Received data for a service:
                 data_to_update = {
                     'ls_next_check': data['next_chk']
                 }
 
                 # Update live state
-                return self.send_to_backend('livestate_service', service_name, data_to_update)
+                return self.update_livestate('service', service_name, data_to_update)
 
         return False
 
+    def update_livestate(self, obj_type, name, data):
+        """Store a live state update to be sent to the backend
+
+        The live state updates are coalesced per object: all the fields received for an object
+        during a loop turn are merged (last received value wins) and only one PATCH request is
+        sent for this object when the live states are flushed (see `send_to_backend`).
+
+        :param obj_type: type of data (host | service)
+        :type obj_type: str
+        :param name: name of host or service
+        :type name: str
+        :param data: dictionary with the live state fields to update
+        :type data: dict
+        :return: True
+        :rtype: bool
+        """
+        if name in self.livestates[obj_type]:
+            self.statsmgr.counter('livestate-coalesced.%s' % obj_type, 1)
+            self.livestates[obj_type][name].update(data)
+        else:
+            self.livestates[obj_type][name] = dict(data)
+        if self.journal is not None:
+            self.journal.append(['ls', obj_type, name, data])
+
+        return True
+
+    def get_livestate_changes(self, obj_type, name, data):
+        """Get the live state fields whose value is not the last one sent to the backend
+
+        If all the fields values were already sent, no PATCH request is needed for this object
+        and the update is counted as suppressed.
+
+        :param obj_type: type of data (host | service)
+        :type obj_type: str
+        :param name: name of host or service
+        :type name: str
+        :param data: dictionary with the live state fields to update
+        :type data: dict
+        :return: dictionary with the fields to update, empty if nothing changed
+        :rtype: dict
+        """
+        if not self.livestate_cache:
+            return data
+
+        item_id = self.mapping[obj_type].get(name)
+        sent = self.livestates_sent[obj_type].get(item_id, {})
+        changes = dict((key, value) for key, value in data.items()
+                       if key not in sent or sent[key] != value)
+        if not changes:
+            self.statsmgr.counter('livestate-suppressed.%s' % obj_type, 1)
+            logger.debug("Live state not changed: %s, %s - %s", obj_type, name, data)
+
+        return changes
+
     def check_result(self, data):
         """
         Got a check result for an host/service
@@ -458,9 +948,11 @@ class AlignakBackendBroker(BaseModule):
         #     del self.ref_live['host'][h_id]['initial_state']
         #     del self.ref_live['host'][h_id]['initial_state_type']
         self.logcheckresults.append(posted_data)
+        if self.journal is not None:
+            self.journal.append(['lcr', posted_data])
 
     def update_status(self, brok):
-        # pylint: disable=too-many-locals
+        # pylint: disable=too-many-locals, too-many-return-statements
         """We manage the status change for a backend host/service/contact
 
         :param brok: the brok
@@ -492,20 +984,125 @@ class AlignakBackendBroker(BaseModule):
                     logger.warning("Got a brok for an unknown service: '%s'", service_name)
                     return None
 
-        # Sort brok properties
-        sorted_brok_properties = sorted(brok.data)
         logger.debug("Update status %s: %s", endpoint, sorted(brok.data))
 
         # Search the concerned element
+        item, cached = self.get_status_item(endpoint, item_id)
+        differences = self.get_status_differences(brok.data, item)
+
+        update = False
+        if differences:
+            logger.info("%s / %s, some modifications exist: %s.",
+                        endpoint, item['name'], differences)
+
+            headers = {
+                'Content-Type': 'application/json',
+                'If-Match': item['_etag']
+            }
+            if cached:
+                # The live state updates do not update the cached item _etag
+                headers['If-Match'] = self.ref_live[endpoint][item_id]['_etag']
+            try:
+                start = time.time()
+                self.statsmgr.counter('backend-patch.%s' % endpoint, 1)
+                if not cached:
+                    response = self.patch_item(endpoint, item_id, differences, headers)
+                else:
+                    try:
+                        response = self.backend.patch('%s/%s' % (endpoint, item_id),
+                                                      differences, headers, False)
+                    except BackendException as exp:
+                        if exp.code != 412:
+                            raise
+                        response = None
+                if response is None:
+                    # The cached item is not up to date, get the item from the backend
+                    self.statsmgr.counter('backend-conflict.%s' % endpoint, 1)
+                    logger.debug("Cached %s %s is outdated", endpoint, name)
+                    self.items_cache[endpoint].pop(item_id, None)
+                    item, cached = self.get_status_item(endpoint, item_id)
+                    differences = self.get_status_differences(brok.data, item)
+                    if not differences:
+                        return False
+                    headers['If-Match'] = item['_etag']
+                    self.statsmgr.counter('backend-patch.%s' % endpoint, 1)
+                    response = self.patch_item(endpoint, item_id, differences, headers)
+                self.statsmgr.timer('backend-patch-time.%s' % endpoint, time.time() - start)
+                if response['_status'] == 'ERR':  # pragma: no cover - should not happen
+                    logger.warning("Update %s: %s failed, errors: %s.",
+                                   endpoint, name, response['_issues'])
+                else:
+                    update = True
+                    logger.info("Updated %s: %s.", endpoint, name)
+                    if item_id in self.items_cache[endpoint]:
+                        item.update(differences)
+                        item['_etag'] = response['_etag']
+
+                if item_id in self.ref_live[endpoint]:
+                    self.ref_live[endpoint][item_id]['_etag'] = response['_etag']
+            except BackendException as exp:  # pragma: no cover - should not happen
+                logger.error("Update %s '%s' failed", endpoint, name)
+                logger.error("Data: %s", differences)
+                self.items_cache[endpoint].pop(item_id, None)
+                if exp.code == 404:
+                    logger.error('Seems the %s %s deleted in the Backend',
+                                 endpoint, name)
+                elif exp.code == 412:
+                    logger.error('Seems the %s %s was modified in the Backend',
+                                 endpoint, name)
+                else:
+                    logger.exception("Exception: %s", exp)
+                    self.backend_failure()
+
+        return update
+
+    def get_status_item(self, endpoint, item_id):
+        """Get the last known backend item for an host/service/contact
+
+        The item is got from the items cache if it is enabled, else it is got from the backend
+
+        :param endpoint: backend endpoint (host | service | user)
+        :type endpoint: str
+        :param item_id: item identifier
+        :type item_id: str
+        :return: tuple (item, True if the item is got from the cache)
+        :rtype: tuple
+        """
+        if item_id in self.items_cache[endpoint]:
+            self.statsmgr.counter('items-cache-hit.%s' % endpoint, 1)
+            return self.items_cache[endpoint][item_id], True
+
         start = time.time()
         self.statsmgr.counter('backend-get.%s' % endpoint, 1)
-        item = self.backend.get(endpoint + '/' + item_id)
+        params = None
+        if self.status_cache:
+            params = {'projection': get_status_projection(endpoint)}
+        item = self.backend.get(endpoint + '/' + item_id, params)
         self.statsmgr.timer('backend-get-time.%s' % endpoint, time.time() - start)
         logger.debug("Found %s: %s", endpoint, sorted(item))
 
+        if self.status_cache:
+            item.pop('_links', None)
+            self.items_cache[endpoint][item_id] = item
+            if item_id in self.ref_live[endpoint]:
+                self.ref_live[endpoint][item_id]['_etag'] = item['_etag']
+
+        return item, False
+
+    @staticmethod
+    def get_status_differences(brok_data, item):
+        """Get the differences between a status brok data and a backend item
+
+        :param brok_data: the brok data
+        :type brok_data: dict
+        :param item: the backend item
+        :type item: dict
+        :return: dictionary with the modified properties
+        :rtype: dict
+        """
         differences = {}
-        for key in sorted_brok_properties:
-            value = brok.data[key]
+        for key in sorted(brok_data):
+            value = brok_data[key]
             # Filter livestate keys...
             if "ls_%s" % key in item:
                 logger.debug("Filtered live state: %s", key)
@@ -545,51 +1142,7 @@ class AlignakBackendBroker(BaseModule):
             else:
                 logger.debug("Identical (%s): '%s'.", key, value)
 
-        update = False
-        if differences:
-            logger.info("%s / %s, some modifications exist: %s.",
-                        endpoint, item['name'], differences)
-
-            headers = {
-                'Content-Type': 'application/json',
-                'If-Match': item['_etag']
-            }
-            try:
-                start = time.time()
-                self.statsmgr.counter('backend-patch.%s' % endpoint, 1)
-                response = self.backend.patch('%s/%s' % (endpoint, item['_id']),
-                                              differences, headers, True)
-                self.statsmgr.counter('backend-patch.%s' % endpoint, 1)
-                self.statsmgr.timer('backend-patch-time.%s' % endpoint, time.time() - start)
-                if response['_status'] == 'ERR':  # pragma: no cover - should not happen
-                    logger.warning("Update %s: %s failed, errors: %s.",
-                                   endpoint, name, response['_issues'])
-                else:
-                    update = True
-                    logger.info("Updated %s: %s.", endpoint, name)
-
-                if endpoint == 'host':
-                    self.ref_live['host'][self.mapping['host'][host_name]]['_etag'] = \
-                        response['_etag']
-                elif endpoint == 'service':
-                    self.ref_live['service'][self.mapping['service'][service_name]]['_etag'] = \
-                        response['_etag']
-            except BackendException as exp:  # pragma: no cover - should not happen
-                logger.error("Update %s '%s' failed", endpoint, name)
-                logger.error("Data: %s", differences)
-                if exp.code == 404:
-                    logger.error('Seems the %s %s deleted in the Backend',
-                                 endpoint, name)
-                elif exp.code == 412:
-                    logger.error('Seems the %s %s was modified in the Backend',
-                                 endpoint, name)
-                else:
-                    logger.exception("Exception: %s", exp)
-                    self.backend_connected = False
-                    self.backend_connection_retry_planned = \
-                        int(time.time()) + self.backend_connection_retry_delay
-
-        return update
+        return differences
 
     def update_program_status(self, brok):
         """Manage the whole program status change
@@ -633,6 +1186,11 @@ class AlignakBackendBroker(BaseModule):
             u'active_host_checks_enabled': True
         }
 
+        The alignak item is got from the backend once and then kept in a cache. The brok
+        data are compared to the cached item and only the modified properties are updated.
+        If `program_status_heartbeat` is set and only the running properties (last_alive,
+        ...) changed, the item is updated at most once during this delay.
+
         :param brok: the brok
         :type brok:
         :return: None
@@ -662,15 +1220,23 @@ class AlignakBackendBroker(BaseModule):
         brok.data['name'] = name
         brok.data['_realm'] = self.default_realm
 
-        params = {'sort': '_id', 'where': '{"name": "%s"}' % name}
-        start = time.time()
-        all_alignak = self.backend.get_all('alignak', params)
-        self.statsmgr.counter('backend-getall.alignak', 1)
-        self.statsmgr.timer('backend-getall-time.alignak', time.time() - start)
-        logger.debug("Got %d Alignak configurations for %s", len(all_alignak['_items']), name)
+        item = self.alignak_items.get(name)
+        if item is None:
+            params = {'sort': '_id', 'where': '{"name": "%s"}' % name}
+            start = time.time()
+            all_alignak = self.backend.get_all('alignak', params)
+            self.statsmgr.counter('backend-getall.alignak', 1)
+            self.statsmgr.timer('backend-getall-time.alignak', time.time() - start)
+            logger.debug("Got %d Alignak configurations for %s",
+                         len(all_alignak['_items']), name)
+            if all_alignak['_items']:
+                item = all_alignak['_items'][0]
+                item.pop('_links', None)
+                self.alignak_items[name] = item
+                self.alignak_updated[name] = time.time()
 
         headers = {'Content-Type': 'application/json'}
-        if not all_alignak['_items']:
+        if item is None:
             try:
                 start = time.time()
                 self.statsmgr.counter('backend-post.alignak', 1)
@@ -680,17 +1246,15 @@ class AlignakBackendBroker(BaseModule):
                     logger.warning("Create alignak: %s failed, errors: %s.",
                                    name, response['_issues'])
                 else:
+                    # The created item will be got from the backend on the next brok
                     logger.info("Created alignak: %s.", name)
             except BackendException as exp:  # pragma: no cover - should not happen
                 logger.error("Create alignak '%s' failed", name)
                 logger.error("Data: %s", brok.data)
                 logger.exception("Exception: %s", exp)
-                self.backend_connected = False
-                self.backend_connection_retry_planned = \
-                    int(time.time()) + self.backend_connection_retry_delay
+                self.backend_failure()
 
         else:
-            item = all_alignak['_items'][0]
             for key in item:
                 if key not in brok.data:
                     continue
@@ -703,30 +1267,39 @@ class AlignakBackendBroker(BaseModule):
                 logger.debug("Nothing to update")
                 return
 
+            if self.program_status_heartbeat and \
+                    time.time() - self.alignak_updated[name] < self.program_status_heartbeat \
+                    and all(key in self.program_status_running for key in brok.data):
+                logger.debug("Only running properties changed, not updated")
+                self.statsmgr.counter('program-status-delayed', 1)
+                return
+
             headers['If-Match'] = item['_etag']
             try:
                 start = time.time()
                 self.statsmgr.counter('backend-patch.alignak', 1)
-                response = self.backend.patch('alignak/%s' % (item['_id']),
-                                              brok.data, headers, True)
+                response = self.patch_item('alignak', item['_id'], brok.data, headers)
                 self.statsmgr.timer('backend-patch-time.alignak', time.time() - start)
                 if response['_status'] == 'ERR':  # pragma: no cover - should not happen
                     logger.warning("Update alignak: %s failed, errors: %s.",
                                    name, response['_issues'])
+                    self.alignak_items.pop(name, None)
                 else:
                     logger.debug("Updated alignak: %s. %s", name, response)
+                    item.update(brok.data)
+                    item['_etag'] = response['_etag']
+                    self.alignak_updated[name] = time.time()
             except BackendException as exp:  # pragma: no cover - should not happen
                 logger.error("Update alignak '%s' failed", name)
                 logger.error("Data: %s", brok.data)
+                self.alignak_items.pop(name, None)
                 if exp.code == 404:
                     logger.error('Seems the alignak %s deleted in the Backend', name)
                 elif exp.code == 412:
                     logger.error('Seems the alignak %s was modified in the Backend', name)
                 else:
                     logger.exception("Exception: %s / %s", exp, exp.response)
-                    self.backend_connected = False
-                    self.backend_connection_retry_planned = \
-                        int(time.time()) + self.backend_connection_retry_delay
+                    self.backend_failure()
 
     def update_actions(self, brok):
         """We manage the acknowledge and downtime broks
@@ -770,11 +1343,11 @@ class AlignakBackendBroker(BaseModule):
 
         if 'service' in brok.data:
             # it's a service
-            cr = self.send_to_backend('livestate_service', service_name, data_to_update)
+            self.update_livestate('service', service_name, data_to_update)
             where['service'] = self.mapping['service'][service_name]
         else:
             # it's a host
-            self.send_to_backend('livestate_host', host_name, data_to_update)
+            self.update_livestate('host', host_name, data_to_update)
 
         params = {
             'where': json.dumps(where)
@@ -797,16 +1370,7 @@ class AlignakBackendBroker(BaseModule):
         # command so we create a new entry
         where['notified'] = True
         # try find the user
-        self.statsmgr.counter('backend-getall.user', 1)
-        users = self.backend.get_all('user',
-                                     {'where': '{"name":"' + brok.data['author'] + '"}'})
-        if users['_items']:
-            where['user'] = users['_items'][0]['_id']
-        else:
-            logger.error("User '%s' is unknown, ack/downtime is set by admin",
-                         brok.data['author'])
-            users = self.backend.get_all('user', {'where': '{"name":"admin"}'})
-            where['user'] = users['_items'][0]['_id']
+        where['user'] = self.get_author_id(brok.data['author'])
 
         if brok.type in ['acknowledge_raise', 'downtime_raise']:
             where['action'] = 'add'
@@ -829,176 +1393,772 @@ class AlignakBackendBroker(BaseModule):
         cr = self.backend.post(endpoint, where)
         return cr['_status'] == 'OK'
 
-    def send_to_backend(self, type_data, name, data):
+    def get_author_id(self, author):
+        """Get the backend user _id of an acknowledge / downtime author
+
+        The author is searched in the users references, then in the authors cache and then
+        in the backend. An unknown author is replaced with the admin user. The authors that
+        are not in the users references are kept in a LRU cache.
+
+        :param author: the author name
+        :type author: str
+        :return: the user _id
+        :rtype: str
         """
-        Send data to alignak backend
+        if author in self.mapping['user']:
+            return self.mapping['user'][author]
 
-        :param type_data: one of ['livestate_host', 'livestate_service', 'log_host', 'log_service']
-        :type type_data: str
+        if author in self.authors_cache:
+            self.authors_cache.move_to_end(author)
+            return self.authors_cache[author]
+
+        self.statsmgr.counter('backend-getall.user', 1)
+        users = self.backend.get_all('user', {'where': json.dumps({'name': author})})
+        if users['_items']:
+            user_id = users['_items'][0]['_id']
+        else:
+            logger.error("User '%s' is unknown, ack/downtime is set by admin", author)
+            if self.admin_user_id is None:
+                if 'admin' in self.mapping['user']:
+                    self.admin_user_id = self.mapping['user']['admin']
+                else:
+                    self.statsmgr.counter('backend-getall.user', 1)
+                    users = self.backend.get_all('user', {'where': '{"name":"admin"}'})
+                    self.admin_user_id = users['_items'][0]['_id']
+            user_id = self.admin_user_id
+
+        self.authors_cache[author] = user_id
+        if len(self.authors_cache) > self.authors_cache_size:
+            self.authors_cache.popitem(last=False)
+        return user_id
+
+    def get_backend(self):
+        """Get a new backend client that uses the module HTTP connections pool
+
+        :return: the backend client
+        :rtype: Backend
+        """
+        return self.instrument_backend(
+            self.http_pool.attach(Backend(self.url, self.client_processes)))
+
+    def instrument_backend(self, backend):
+        """Measure the requests of a backend client
+
+        The backend client request methods are replaced with methods that measure each
+        request duration in a histogram named with the request verb and endpoint.
+
+        :param backend: backend client
+        :type backend: Backend
+        :return: the backend client
+        :rtype: Backend
+        """
+        def timed(verb, request):
+            """Get a request method that measures the request duration"""
+            def timed_request(endpoint, *args, **kwargs):
+                """Send the request and measure its duration"""
+                start = time.time()
+                try:
+                    return request(endpoint, *args, **kwargs)
+                finally:
+                    self.metrics.observe('http.%s.%s' % (verb, endpoint.strip('/').split('/')[0]),
+                                         time.time() - start)
+            return timed_request
+
+        for verb in ['get', 'get_all', 'post', 'patch', 'put']:
+            setattr(backend, verb, timed(verb, getattr(backend, verb)))
+        return backend
+
+    def manage_signal(self, sig, frame):
+        """Manage the signals received by the module process
+
+        SIGUSR1 requests a dump of the latency histograms, SIGUSR2 requests a profiling
+        session, the other signals are managed by the base module. With several shards, the
+        module process forwards SIGUSR1 to the shards processes that manage the broks.
+
+        :param sig: signal sent
+        :type sig: int
+        :param frame: frame before catching signal
+        :type frame:
+        :return: None
+        """
+        if sig == signal.SIGUSR1:
+            if self.shard_processes:
+                for process in self.shard_processes:
+                    if process.is_alive():
+                        os.kill(process.pid, signal.SIGUSR1)
+                return
+            self.metrics_dump_requested = True
+            return
+        if sig == signal.SIGUSR2:
+            self.profiler.request()
+            return
+        super(AlignakBackendBroker, self).manage_signal(sig, frame)
+
+    def dump_metrics(self):
+        """Log the latency histograms and write them in the metrics dump file, if any
+
+        :return: None
+        """
+        self.metrics_dump_requested = False
+        stats = self.metrics.get_stats()
+        logger.info("Latency histograms since %d seconds:",
+                    int(time.time() - self.metrics.started))
+        for name, histogram in sorted(stats.items()):
+            logger.info("- %s: count %d, p50 %.6f, p95 %.6f, p99 %.6f, max %.6f", name,
+                        histogram['count'], histogram['p50'], histogram['p95'],
+                        histogram['p99'], histogram['max'])
+        if self.metrics_dump_file:
+            try:
+                with open(self.metrics_dump_file, 'w') as dump_file:
+                    json.dump(stats, dump_file, indent=2, sort_keys=True)
+            except (IOError, OSError) as exp:
+                logger.error("Error when writing the metrics dump file: %s", exp)
+
+    def get_sender_pool(self):
+        """Get the sender workers pool and the backend client used by each worker
+
+        The pool is lazily created because the module process is forked after its
+        initialization. Each worker has its own backend client (and HTTP session) that
+        shares the module backend token and HTTP connections pool.
+
+        :return: tuple (thread pool executor, list of backend clients)
+        """
+        if self.sender_pool is None:
+            workers = max(self.sender_workers, self.lcr_workers)
+            logger.info("Starting %d sender workers", workers)
+            self.sender_pool = ThreadPoolExecutor(max_workers=workers)
+            self.sender_backends = [self.get_backend() for _ in range(workers)]
+
+        # The module token may have changed since the last call
+        for backend in self.sender_backends:
+            if backend.token != self.backend.token:
+                backend.token = self.backend.token
+
+        return self.sender_pool, self.sender_backends
+
+    def send_livestates(self, livestates, backend):
+        """Send a list of live states to the backend
+
+        :param livestates: list of (type of data, name of host or service, data) tuples
+        :type livestates: list
+        :param backend: backend client to use
+        :type backend: Backend
+        :return: True if all the updates are ok, False otherwise
+        :rtype: bool
+        """
+        ret = True
+        for index, (obj_type, name, data) in enumerate(livestates):
+            patched = self.backend_connected and \
+                self.patch_livestate(obj_type, name, data, backend)
+            if not self.backend_connected:
+                # Not available, or the update failed
+                logger.error("Alignak backend connection is not available. "
+                             "Skipping live states update.")
+                self.keep_livestates(livestates[index:])
+                return False
+            if not patched:
+                ret = False
+
+        return ret
+
+    def keep_livestates(self, livestates):
+        """Keep the live states that were not sent because the backend is not available
+
+        If a journal is configured, they are kept pending (and journaled) to be sent on a
+        next loop turn, else they are lost.
+
+        :param livestates: list of (type of data, name of host or service, data) tuples
+        :type livestates: list
+        :return: None
+        """
+        if self.journal is None:
+            return
+
+        logger.warning("%d live states not sent, kept to be sent later", len(livestates))
+        for obj_type, name, data in livestates:
+            pending = self.livestates[obj_type].setdefault(name, {})
+            for key, value in data.items():
+                # The updates received meanwhile are more recent
+                pending.setdefault(key, value)
+
+    def patch_livestate(self, obj_type, name, data, backend=None):
+        """Patch the live state of an host or a service in the backend
+
+        The object _etag stored in the ref_live is updated with the one got in the response
+
+        :param obj_type: type of data (host | service)
+        :type obj_type: str
         :param name: name of host or service
         :type name: str
-        :param data: dictionary with data to add / update
+        :param data: dictionary with data to update
         :type data: dict
-        :return: True if send is ok, False otherwise
+        :param backend: backend client to use, default is to use the module backend client
+        :type backend: Backend
+        :return: True if patch is ok, False otherwise
         :rtype: bool
         """
-        if not self.backend_connected and int(time.time() > self.backend_connection_retry_planned):
-            self.backend_connected = self.backend_connection()
+        if backend is None:
+            backend = self.backend
 
-        if not self.backend_connected:
-            logger.error("Alignak backend connection is not available. "
-                         "Skipping objects update.")
-            return None
-        logger.debug("Send to backend: %s, %s", type_data, data)
+        item_id = self.mapping[obj_type].get(name)
+        if item_id not in self.ref_live[obj_type]:
+            logger.warning("Live state of an unknown %s: %s, not updated", obj_type, name)
+            return False
 
         headers = {
             'Content-Type': 'application/json',
+            'If-Match': self.ref_live[obj_type][item_id]['_etag']
         }
         ret = True
-        if type_data == 'livestate_host':
-            headers['If-Match'] = self.ref_live['host'][self.mapping['host'][name]]['_etag']
+        try:
+            start = time.time()
+            self.statsmgr.counter('backend-patch.%s' % obj_type, 1)
+            logger.debug("Send to backend: %s, %s (_etag: %s) - %s",
+                         obj_type, name, headers['If-Match'], data)
+            response = self.patch_item(obj_type, item_id, data, headers, backend)
+            self.statsmgr.timer('backend-patch-time.%s' % obj_type, time.time() - start)
+            if response['_status'] == 'ERR':  # pragma: no cover - should not happen
+                logger.error('%s', response['_issues'])
+                ret = False
+            else:
+                self.ref_live[obj_type][item_id]['_etag'] = response['_etag']
+                logger.debug("Updated _etag: %s, %s (_etag: %s)",
+                             obj_type, name, response['_etag'])
+                if self.livestate_cache:
+                    self.livestates_sent[obj_type].setdefault(item_id, {}).update(data)
+        except BackendException as exp:  # pragma: no cover - should not happen
+            logger.error('Patch livestate for %s %s (%s) error', obj_type, name, item_id)
+            logger.error('Data: %s', data)
+            logger.exception("Exception: %s", exp)
+            if exp.code == 404:
+                logger.error('Seems the %s %s deleted in the Backend', obj_type, item_id)
+            elif exp.code == 412:
+                logger.error('Seems the %s %s was modified in the Backend', obj_type, item_id)
+                ret = False
+            else:
+                self.backend_failure()
+
+        return ret
+
+    def patch_item(self, endpoint, item_id, data, headers, backend=None):
+        """Patch an item in the backend and recover from an _etag conflict
+
+        If the backend refuses the update because the item was modified since its _etag was
+        got (HTTP 412), only the item _etag is got from the backend and the update is retried
+        once with this _etag. The object reference _etag is updated with the new one.
+
+        :param endpoint: backend endpoint (host | service | user)
+        :type endpoint: str
+        :param item_id: item identifier
+        :type item_id: str
+        :param data: dictionary with data to update
+        :type data: dict
+        :param headers: request headers, including the If-Match header
+        :type headers: dict
+        :param backend: backend client to use, default is to use the module backend client
+        :type backend: Backend
+        :return: the backend response
+        :rtype: dict
+        """
+        if backend is None:
+            backend = self.backend
+
+        sent = self.livestates_sent.get(endpoint, {})
+        try:
+            response = backend.patch('%s/%s' % (endpoint, item_id), data, headers, False)
+            if item_id in sent:
+                # Keep the sent live state values up to date (eg. status update)
+                sent[item_id].update((key, value) for key, value in data.items()
+                                     if key in sent[item_id])
+            return response
+        except BackendException as exp:
+            if exp.code != 412:
+                raise
+
+        # The item was modified by another client, its live state is not known anymore
+        sent.pop(item_id, None)
+        self.statsmgr.counter('backend-conflict.%s' % endpoint, 1)
+        logger.info("The %s %s was modified in the backend, getting its _etag",
+                    endpoint, item_id)
+        item = backend.get('%s/%s' % (endpoint, item_id),
+                           params={'projection': json.dumps({'_etag': 1})})
+        if item_id in self.ref_live.get(endpoint, {}):
+            self.ref_live[endpoint][item_id]['_etag'] = item['_etag']
+
+        headers = dict(headers)
+        headers['If-Match'] = item['_etag']
+        return backend.patch('%s/%s' % (endpoint, item_id), data, headers, False)
+
+    def post_next_checks(self):
+        """Post the accumulated next checks to the bulk next checks endpoint
+
+        The next checks are posted by batches of `next_check_bulk_size` items:
+        [{'item_type': 'host', 'item_id': '5a...', 'ls_next_check': 1518...}, ...]
+
+        If the backend response contains the updated items (`_items` list in the same order,
+        with their `_id` and `_etag`), the objects references _etag are updated.
+
+        :return: True if all the batches are posted, False otherwise
+        :rtype: bool
+        """
+        items = []
+        for obj_type in ['host', 'service']:
+            for name, next_check in self.next_checks[obj_type].items():
+                if name not in self.mapping[obj_type] or not self.get_livestate_changes(
+                        obj_type, name, {'ls_next_check': next_check}):
+                    continue
+                items.append({
+                    'item_type': obj_type,
+                    'item_id': self.mapping[obj_type][name],
+                    'ls_next_check': next_check
+                })
+            self.next_checks[obj_type] = {}
+        self.next_checks_flushed = time.time()
+
+        for index in range(0, len(items), self.next_check_bulk_size):
+            batch = items[index:index + self.next_check_bulk_size]
             try:
                 start = time.time()
-                # self.statsmgr.counter('backend-patch.host', 1)
-                response = self.backend.patch(
-                    'host/%s' % self.ref_live['host'][self.mapping['host'][name]]['_id'],
-                    data, headers, True)
-                self.statsmgr.timer('backend-patch-time.host', time.time() - start)
-                if response['_status'] == 'ERR':  # pragma: no cover - should not happen
-                    logger.error('%s', response['_issues'])
-                    ret = False
-                else:
-                    self.ref_live['host'][self.mapping['host'][name]]['_etag'] = response['_etag']
-            except BackendException as exp:  # pragma: no cover - should not happen
-                logger.error('Patch livestate for host %s error', self.mapping['host'][name])
-                logger.error('Data: %s', data)
-                logger.exception("Exception: %s", exp)
-                if exp.code == 404:
-                    logger.error('Seems the host %s deleted in the Backend',
-                                 self.mapping['host'][name])
-                elif exp.code == 412:
-                    logger.error('Seems the host %s was modified in the Backend',
-                                 self.mapping['host'][name])
-                    ret = False
-                else:
-                    self.backend_connected = False
-                    self.backend_connection_retry_planned = \
-                        int(time.time()) + self.backend_connection_retry_delay
-        elif type_data == 'livestate_service':
-            service_id = self.mapping['service'][name]
-            headers['If-Match'] = self.ref_live['service'][service_id]['_etag']
+                self.statsmgr.counter('backend-post.next-check', 1)
+                response = self.compression.post(self.backend, self.next_check_bulk_endpoint,
+                                                 batch)
+                self.statsmgr.timer('backend-post-time.next-check', time.time() - start)
+            except BackendException as exp:
+                logger.error("Error when posting %d next checks to the backend: %s",
+                             len(items) - index, exp)
+                self.backend_failure()
+                return False
+            if response['_status'] == 'ERR':  # pragma: no cover - should not happen
+                logger.error("Issues when posting next checks to the backend: %s",
+                             response.get('_issues'))
+                continue
+
+            updated = response.get('_items', [])
+            for position, item in enumerate(batch):
+                ref_live = self.ref_live[item['item_type']].get(item['item_id'])
+                if position < len(updated) and updated[position].get('_id') == item['item_id']:
+                    if ref_live is not None and '_etag' in updated[position]:
+                        ref_live['_etag'] = updated[position]['_etag']
+                if self.livestate_cache:
+                    self.livestates_sent[item['item_type']].setdefault(
+                        item['item_id'], {})['ls_next_check'] = item['ls_next_check']
+        self.statsmgr.gauge('next-checks-count', len(items))
+
+        return True
+
+    def get_lcr_batches(self, lcrs):
+        """Split a list of log check results in batches to be posted to the backend
+
+        A batch contains at most `lcr_batch_count` items and, if `lcr_batch_size` is set,
+        its serialized size is at most `lcr_batch_size` bytes (a single bigger item is
+        posted alone)
+
+        :param lcrs: list of log check results
+        :type lcrs: list
+        :return: list of (items list, serialized size) tuples
+        :rtype: list
+        """
+        batches = []
+        batch, batch_size = [], 0
+        for lcr in lcrs:
+            size = len(json.dumps(lcr))
+            if batch and (len(batch) >= self.lcr_batch_count or
+                          (self.lcr_batch_size and
+                           batch_size + size > self.lcr_batch_size)):
+                batches.append((batch, batch_size))
+                batch, batch_size = [], 0
+            batch.append(lcr)
+            batch_size += size
+        if batch:
+            batches.append((batch, batch_size))
+
+        return batches
+
+    def post_lcrs(self, batches, backend):
+        """Post some batches of log check results to the backend
+
+        :param batches: list of (items list, serialized size) tuples
+        :type batches: list
+        :param backend: backend client to use
+        :type backend: Backend
+        :return: list of the batches that could not be posted
+        :rtype: list
+        """
+        failed = []
+        for lcrs, size in batches:
+            start = time.time()
             try:
-                start = time.time()
-                self.statsmgr.counter('backend-patch.service', 1)
-                logger.debug("Send to backend: %s, %s (_etag: %s) - %s",
-                             type_data, name,
-                             self.ref_live['service'][service_id]['_etag'],
-                             data)
-                response = self.backend.patch('service/%s' %
-                                              self.ref_live['service'][service_id]['_id'],
-                                              data, headers, True)
-                self.statsmgr.timer('backend-patch-time.service', time.time() - start)
-                if response['_status'] == 'ERR':  # pragma: no cover - should not happen
-                    logger.error('%s', response['_issues'])
-                    ret = False
-                else:
-                    self.ref_live['service'][service_id]['_etag'] = response['_etag']
-                    logger.debug("Updated _etag: %s, %s (_etag: %s)",
-                                 type_data, name,
-                                 self.ref_live['service'][self.mapping['service'][name]]['_etag'])
-            except BackendException as exp:  # pragma: no cover - should not happen
-                logger.error('Patch livestate for %s/%s %s error',
-                             type_data, name, self.mapping['service'][name])
-                logger.error('Data: %s', data)
-                logger.exception("Exception: %s", exp)
-                if exp.code == 404:
-                    logger.error('Seems the service %s deleted in the Backend',
-                                 self.mapping['service'][name])
-                elif exp.code == 412:
-                    logger.error('Seems the service %s was modified in the Backend',
-                                 self.mapping['service'][name])
-                    ret = False
-                else:
-                    self.backend_connected = False
-                    self.backend_connection_retry_planned = \
-                        int(time.time()) + self.backend_connection_retry_delay
-        elif type_data == 'lcrs':
-            response = {'_status': 'OK'}
+                response = self.compression.post(backend, 'logcheckresult', lcrs)
+            except BackendException as exp:
+                logger.error("Error when posting %d LCRs (%d bytes) to the backend: %s",
+                             len(lcrs), size, exp)
+                failed.append((lcrs, size))
+                continue
+            self.statsmgr.timer('backend-post-time.lcr', time.time() - start)
+            self.statsmgr.counter('backend-post.lcr', len(lcrs))
+            logger.debug("Posted %d LCRs (%d bytes)", len(lcrs), size)
+
+            if response['_status'] == 'ERR':  # pragma: no cover - should not happen
+                logger.error('Error when posting LCR to the backend, data: %s', lcrs)
+                logger.error('Issues: %s', response['_issues'])
+
+        return failed
+
+    def sync_journal(self):
+        """Write the journal records, fsync the journal if the fsync interval elapsed
+
+        :return: None
+        """
+        start = time.time()
+        if self.journal.sync():
+            self.statsmgr.timer('journal-fsync-time', time.time() - start)
+
+    def get_journal_pending(self):
+        """Get the journal records of the updates that are still pending
+
+        :return: list of journal records
+        :rtype: list
+        """
+        records = [['lcr', lcr] for lcr in self.logcheckresults]
+        for obj_type in ['host', 'service']:
+            for name, data in self.livestates[obj_type].items():
+                records.append(['ls', obj_type, name, data])
+        records.extend(['ls'] + list(livestate) for livestate in self.journal_livestates)
+
+        return records
+
+    def limit_pending_lcrs(self):
+        """Drop the oldest pending log check results over the `journal_max_lcrs` limit
+
+        The journaled log check results are kept pending while the backend is not available
+        and no spool is configured; this limit bounds the memory they use.
+
+        :return: number of dropped log check results
+        :rtype: int
+        """
+        dropped = len(self.logcheckresults) - self.journal_max_lcrs
+        if dropped <= 0:
+            return 0
+
+        logger.error("Too many pending LCRs, dropping the %d oldest ones", dropped)
+        self.statsmgr.counter('journal-dropped.lcr', dropped)
+        self.logcheckresults = self.logcheckresults[dropped:]
+        return dropped
+
+    def commit_journal(self):
+        """Truncate the journal once all the journaled updates are sent
+
+        While some updates are still pending, the new records are only appended to the
+        journal. The journal is rewritten with the pending updates only when it holds more
+        than twice as many records, so the disk writes stay proportional to the updates count.
+
+        :return: None
+        """
+        if not len(self.journal):
+            return
+
+        pending = self.get_journal_pending()
+        if not pending:
+            self.journal.commit()
+        elif len(self.journal) > 2 * max(len(pending), self.journal_max_lcrs):
+            self.journal.commit(pending)
+            self.statsmgr.counter('journal-compacted', 1)
+
+    def replay_journal(self):
+        """Replay the updates journaled and not sent by the previous module run
+
+        The log check results are sent to the backend (or spooled) now. If the backend is not
+        available and no spool is configured, they are kept pending (and journaled) until they
+        are sent by the module loop. The live states updates are replayed when the objects
+        references are loaded.
+
+        :return: None
+        """
+        records = self.journal.read()
+        if not records:
+            return
+        logger.warning("Replaying %d journaled updates", len(records))
+        self.statsmgr.counter('journal-replayed', len(records))
+
+        self.logcheckresults = []
+        for record in records:
+            if record[0] == 'lcr':
+                self.logcheckresults.append(record[1])
+            elif record[0] == 'ls':
+                self.journal_livestates.append(record[1:])
+        self.limit_pending_lcrs()
+        if self.logcheckresults:
+            # The log check results list is emptied only if they are posted or spooled
+            self.send_to_backend('lcrs', None, None)
+
+        self.journal.commit(self.get_journal_pending())
+        self.journal.sync(force=True)
+
+    def replay_journal_livestates(self):
+        """Replay the journaled live states updates
+
+        The updates of the objects that are not known anymore are dropped.
+
+        :return: None
+        """
+        replayed = 0
+        for obj_type, name, data in self.journal_livestates:
+            if name in self.mapping[obj_type]:
+                self.update_livestate(obj_type, name, data)
+                replayed += 1
+        logger.info("Replayed %d journaled live states updates (%d dropped)",
+                    replayed, len(self.journal_livestates) - replayed)
+        self.journal_livestates = []
+
+    def spool_lcrs(self):
+        """Store the log check results in the spool
+
+        The log check results list is emptied, unless no spool is configured
+
+        :return: None
+        """
+        if self.spool is None or not self.logcheckresults:
+            return
+
+        try:
+            count = self.spool.append(self.logcheckresults)
+            logger.warning("Spooled %d LCRs, spool depth: %d", count, len(self.spool))
+            self.statsmgr.counter('spool-append.lcr', count)
+        except (IOError, OSError) as exp:
+            logger.error("Error when spooling %d LCRs: %s", len(self.logcheckresults), exp)
+        self.logcheckresults = []
+
+    def drain_spool(self):
+        """Post the spooled log check results to the backend
+
+        At most `spool_drain_count` items are posted every `spool_drain_interval` seconds to
+        limit the backend load when it comes back, and the time spent out of the broks
+        management
+
+        :return: number of posted items
+        :rtype: int
+        """
+        if self.spool is None or not len(self.spool):
+            return 0
+
+        if time.time() - self.spool_drained < self.spool_drain_interval:
+            return 0
+        self.spool_drained = time.time()
+
+        if not self.check_backend_connection():
+            return 0
+
+        start = time.time()
+        posted = 0
+        while posted < self.spool_drain_count and len(self.spool):
+            lcrs, position = self.spool.read(min(self.lcr_batch_count,
+                                                 self.spool_drain_count - posted))
             try:
-                logger.debug("Posting %d LCRs to the backend", len(self.logcheckresults))
-                while self.logcheckresults:
-                    start = time.time()
-                    lcrs = self.logcheckresults[:100]
-                    self.statsmgr.counter('backend-post.lcr', len(lcrs))
-                    response = self.backend.post(endpoint='logcheckresult', data=lcrs)
-                    logger.debug("Posted %d LCRs", len(lcrs))
-                    del self.logcheckresults[:100]
-                self.logcheckresults = []
+                if lcrs:
+                    response = self.compression.post(self.backend, 'logcheckresult', lcrs)
+                    if response['_status'] == 'ERR':  # pragma: no cover - should not happen
+                        logger.error('Issues when posting spooled LCR to the backend: %s',
+                                     response['_issues'])
             except BackendException as exp:  # pragma: no cover - should not happen
-                logger.error('Error when posting LCR to the backend, data: %s',
-                             self.logcheckresults)
-                logger.error("Exception: %s", exp)
-                self.backend_connected = False
-                self.backend_connection_retry_planned = \
-                    int(time.time()) + self.backend_connection_retry_delay
+                logger.error("Error when posting spooled LCR to the backend: %s", exp)
+                self.backend_failure()
+                break
+            self.spool.ack(position)
+            posted += len(lcrs)
+
+        if posted:
+            logger.info("Posted %d spooled LCRs, spool depth: %d", posted, len(self.spool))
+            self.statsmgr.counter('backend-post.lcr-spool', posted)
+            self.statsmgr.timer('backend-post-time.lcr-spool', time.time() - start)
+
+        return posted
+
+    def send_to_backend(self, type_data, name, data):
+        # pylint: disable=too-many-locals
+        """
+        Send data to alignak backend
+
+        :param type_data: one of ['livestate_host', 'livestate_service', 'livestates', 'lcrs',
+        'next_checks']
+        :type type_data: str
+        :param name: name of host or service
+        :type name: str
+        :param data: dictionary with data to add / update
+        :type data: dict
+        :return: True if send is ok, False otherwise
+        :rtype: bool
+        """
+        if not self.check_backend_connection():
+            logger.error("Alignak backend connection is not available. "
+                         "Skipping objects update.")
+            if type_data == 'lcrs':
+                self.spool_lcrs()
+            if type_data == 'next_checks':
+                self.next_checks = {'host': {}, 'service': {}}
+            return None
+        logger.debug("Send to backend: %s, %s", type_data, data)
+
+        ret = True
+        if type_data in ['livestate_host', 'livestate_service']:
+            ret = self.patch_livestate(type_data.replace('livestate_', ''), name, data)
+        elif type_data == 'livestates':
+            start = time.time()
+            livestates = []
+            for obj_type in ['host', 'service']:
+                for item_name in self.livestates[obj_type]:
+                    if item_name not in self.mapping[obj_type]:
+                        # Deleted or renamed by a configuration reload since the update
+                        logger.debug("Live state of an unknown %s: %s", obj_type, item_name)
+                        continue
+                    data = self.get_livestate_changes(obj_type, item_name,
+                                                      self.livestates[obj_type][item_name])
+                    if data:
+                        livestates.append((obj_type, item_name, data))
+                self.livestates[obj_type] = {}
+            logger.debug("Patching %d live states", len(livestates))
+
+            if self.sender_workers > 1 and len(livestates) > 1:
+                # Dispatch the live states to the sender workers. An object is always sent by
+                # the same worker to preserve the updates ordering and the _etag chaining
+                shards = [[] for _ in range(self.sender_workers)]
+                for livestate in livestates:
+                    shards[hash(livestate[1]) % self.sender_workers].append(livestate)
+                pool, backends = self.get_sender_pool()
+                futures = [pool.submit(self.send_livestates, shard, backends[index])
+                           for index, shard in enumerate(shards) if shard]
+                for future in futures:
+                    if not future.result():
+                        ret = False
             else:
-                self.statsmgr.timer('backend-post-time.lcr', time.time() - start)
+                ret = self.send_livestates(livestates, self.backend)
+            self.statsmgr.gauge('livestates-count', len(livestates))
+            self.statsmgr.timer('backend-patch-time.livestates', time.time() - start)
+            self.metrics.observe('flush.livestates', time.time() - start)
+        elif type_data == 'next_checks':
+            ret = self.post_next_checks()
+        elif type_data == 'lcrs':
+            if self.spool is not None and len(self.spool):
+                # Preserve the check results ordering while the spool is not drained
+                self.spool_lcrs()
+                return ret
 
-                if response['_status'] == 'ERR':  # pragma: no cover - should not happen
+            start = time.time()
+            batches = self.get_lcr_batches(self.logcheckresults)
+            self.metrics.observe('serialize.lcrs', time.time() - start)
+            self.logcheckresults = []
+            logger.debug("Posting %d LCRs batches to the backend", len(batches))
+
+            if self.lcr_workers > 1 and len(batches) > 1:
+                # Dispatch the batches to the sender workers
+                pool, backends = self.get_sender_pool()
+                futures = [pool.submit(self.post_lcrs, batches[index::self.lcr_workers],
+                                       backends[index])
+                           for index in range(min(self.lcr_workers, len(batches)))]
+                failed = [batch for future in futures for batch in future.result()]
+            else:
+                failed = self.post_lcrs(batches, self.backend)
+
+            if failed:
+                # Retry only the failed batches, once
+                logger.warning("Retrying to post %d LCRs batches", len(failed))
+                self.statsmgr.counter('backend-post-retry.lcr', len(failed))
+                failed = self.post_lcrs(failed, self.backend)
+
+            if failed:
+                self.logcheckresults = [lcr for lcrs, _ in failed for lcr in lcrs]
+                if self.spool is not None:
+                    self.spool_lcrs()
+                elif self.journal is not None:
+                    # Kept pending (and journaled) to be posted later
+                    logger.warning('Error when posting %d LCRs to the backend, kept to be '
+                                   'posted later', len(self.logcheckresults))
+                else:
                     logger.error('Error when posting LCR to the backend, data: %s',
                                  self.logcheckresults)
-                    logger.error('Issues: %s', response['_issues'])
-                    ret = False
+                    self.logcheckresults = []
+                self.backend_failure()
+                ret = False
+
+            # Throughput statistics, of the posted batches only
+            duration = time.time() - start
+            failed_count = sum(len(lcrs) for lcrs, _ in failed)
+            if failed_count:
+                self.statsmgr.counter('backend-post-failed.lcr', failed_count)
+            count = sum(len(lcrs) for lcrs, _ in batches) - failed_count
+            size = sum(batch_size for _, batch_size in batches) - \
+                sum(batch_size for _, batch_size in failed)
+            self.statsmgr.timer('backend-post-time.lcrs', duration)
+            self.metrics.observe('flush.lcrs', duration)
+            self.statsmgr.gauge('backend-post-batches.lcr', len(batches))
+            if duration > 0:
+                self.statsmgr.gauge('backend-post-rate.lcr', int(count / duration))
+                self.statsmgr.gauge('backend-post-bytes-rate.lcr', int(size / duration))
 
         return ret
 
+    def register_brok_handler(self, brok_type, brok_handler, resolve=False, queued=False):
+        """Register the function used to manage a brok type
+
+        :param brok_type: the brok type
+        :type brok_type: str
+        :param brok_handler: function called with the brok as parameter, its result is returned
+        by `manage_brok`
+        :type brok_handler: callable
+        :param resolve: True if the brok concerned object must be known to manage the brok
+        :type resolve: bool
+        :param queued: True if the handler only queues data to be sent later to the backend,
+        else the brok is not managed while the backend is not available
+        :type queued: bool
+        :return: None
+        """
+        self.brok_handlers[brok_type] = (brok_handler, resolve, queued)
+
     def manage_brok(self, brok):
+        # pylint: disable=too-many-return-statements
         """
         We get the data to manage
 
+        The brok is prepared here, and only once, if its type is managed by the module. The
+        broks of the other types are ignored without decoding their data.
+
         :param brok: Brok object
         :type brok: object
         :return: False if broks were not managed by the module
         """
         if not self.logged_in:
-            if not self.backend_connection():
+            if not self.check_backend_connection():
                 logger.debug("Not logged-in, ignoring broks...")
                 return False
 
+        if brok.type not in self.brok_handlers:
+            logger.debug("Ignoring a brok: %s", brok.type)
+            return False
+        brok_handler, resolve, queued = self.brok_handlers[brok.type]
+        if not queued and not self.check_backend_connection():
+            # The handler requests the backend, wait for the circuit breaker to be closed
+            logger.debug("Backend not available, ignoring a brok: %s", brok.type)
+            self.statsmgr.counter('backend-breaker-rejected.%s' % brok.type, 1)
+            return False
+
+        received = time.time()
         brok.prepare()
+        self.metrics.observe('prepare', time.time() - received)
 
         logger.debug("manage_brok receives a Brok:")
         logger.debug("\t-Brok: %s - %s", brok.type, brok.data)
 
         try:
-            endpoint = ''
-            name = ''
-            # Temporary: get concerned item for tracking received broks
-            if 'contact_name' in brok.data:
-                contact_name = brok.data['contact_name']
-                if brok.data['contact_name'] not in self.mapping['user']:
-                    logger.debug("Got a brok %s for an unknown user: '%s' (%s)",
-                                 brok.type, contact_name, brok.data)
+            endpoint, name = '', ''
+            if resolve:
+                # Get concerned item for tracking received broks
+                start = time.time()
+                concerned = self.get_brok_object(brok)
+                self.metrics.observe('resolve', time.time() - start)
+                if concerned is None:
+                    return False
+                endpoint, name = concerned
+                if brok.type in self.broks_sampling and self.sample_brok(brok.type, name):
                     return False
-                endpoint = 'user'
-                name = contact_name
-            else:
-                if 'host_name' in brok.data:
-                    host_name = brok.data['host_name']
-                    if brok.data['host_name'] not in self.mapping['host']:
-                        logger.debug("Got a brok %s for an unknown host: '%s' (%s)",
-                                     brok.type, host_name, brok.data)
-                        return False
-                    endpoint = 'host'
-                    name = host_name
-                    if 'service_description' in brok.data:
-                        service_name = '__'.join([host_name, brok.data['service_description']])
-                        endpoint = 'service'
-                        name = service_name
-                        if service_name not in self.mapping['service']:
-                            logger.debug("Got a brok %s for an unknown service: '%s' (%s)",
-                                         brok.type, service_name, brok.data)
-                            return False
             if name:
                 logger.debug("Received a brok: %s, for %s '%s'", brok.type, endpoint, name)
             else:
@@ -1008,40 +2168,275 @@ class AlignakBackendBroker(BaseModule):
             start = time.time()
             self.statsmgr.counter('managed-broks-type-count.%s' % brok.type, 1)
 
-            ret = False
-            if brok.type in ['new_conf']:
-                ret = self.get_refs()
+            ret = brok_handler(brok)
 
-            if self.manage_update_program_status and \
-                    brok.type in ['program_status', 'update_program_status']:
-                self.update_program_status(brok)
-                ret = None
+            self.statsmgr.timer('managed-broks-type-time-%s' % brok.type, time.time() - start)
+            self.metrics.observe('brok.%s' % brok.type, time.time() - received)
 
-            if brok.type == 'host_next_schedule':
-                ret = self.update_next_check(brok.data, 'host')
-            if brok.type == 'service_next_schedule':
-                ret = self.update_next_check(brok.data, 'service')
+            return ret
+        except Exception as exp:  # pragma: no cover - should not happen
+            logger.exception("Manage brok exception: %s", exp)
 
-            if brok.type in ['update_host_status', 'update_service_status',
-                             'update_contact_status']:
-                ret = self.update_status(brok)
+        return False
 
-            if brok.type in ['host_check_result', 'service_check_result']:
-                self.check_result(brok.data)
-                ret = None
+    def sample_brok(self, brok_type, name):
+        """Check if a brok must be dropped because of the broks sampling
 
-            if brok.type in ['acknowledge_raise', 'acknowledge_expire',
-                             'downtime_raise', 'downtime_expire']:
-                ret = self.update_actions(brok)
+        Only one brok of a sampled type is managed for an object during the configured delay
 
-            self.statsmgr.timer('managed-broks-type-time-%s' % brok.type, time.time() - start)
+        :param brok_type: the brok type
+        :type brok_type: str
+        :param name: the brok concerned object name
+        :type name: str
+        :return: True if the brok must be dropped
+        :rtype: bool
+        """
+        now = time.time()
+        sampled = self.broks_sampled[brok_type]
+        if name in sampled and now - sampled[name] < self.broks_sampling[brok_type]:
+            logger.debug("Dropped a sampled brok: %s, for '%s'", brok_type, name)
+            self.statsmgr.counter('sampled-broks-dropped.%s' % brok_type, 1)
+            return True
 
-            return ret
-        except Exception as exp:  # pragma: no cover - should not happen
-            logger.exception("Manage brok exception: %s", exp)
+        sampled[name] = now
+        return False
+
+    def get_shedding_level(self, queue_size):
+        """Get the load shedding level according to the module queue size
+
+        * 0: the queue size is under the high water mark, no shedding
+        * 1: the queue size is over the high water mark, the `shed_broks` types are dropped
+        * 2: the queue size is over twice the high water mark, the `shed_broks_critical`
+          types are also dropped
+
+        :param queue_size: number of messages in the module queue
+        :type queue_size: int
+        :return: shedding level
+        :rtype: int
+        """
+        level = 0
+        if self.queue_high_water and queue_size >= self.queue_high_water:
+            level = 2 if queue_size >= 2 * self.queue_high_water else 1
+            logger.warning("Module queue size is %d messages, shedding level: %d",
+                           queue_size, level)
+        self.statsmgr.gauge('shedding-level', level)
+        return level
+
+    def shed_brok(self, brok, level):
+        """Check if a brok must be dropped to reduce the module load
+
+        A brok older than `queue_max_age` is dropped as if the shedding level was 1. With the
+        default configuration, the check results, acknowledges and downtimes broks are never
+        dropped.
+
+        :param brok: Brok object
+        :type brok: object
+        :param level: shedding level
+        :type level: int
+        :return: True if the brok must be dropped
+        :rtype: bool
+        """
+        if not level and self.queue_max_age and \
+                time.time() - brok.creation_time > self.queue_max_age:
+            level = 1
+        if not level:
+            return False
 
+        if brok.type in self.shed_broks or \
+                (level > 1 and brok.type in self.shed_broks_critical):
+            logger.debug("Dropped a brok: %s", brok.type)
+            self.shed_counts[brok.type] = self.shed_counts.get(brok.type, 0) + 1
+            return True
         return False
 
+    def get_brok_object(self, brok):
+        # pylint: disable=too-many-return-statements
+        """Get the host/service/user concerned by a brok
+
+        :param brok: Brok object
+        :type brok: object
+        :return: tuple (endpoint, name), ('', '') if the brok do not concern an object, or
+        None if the concerned object is unknown
+        :rtype: tuple
+        """
+        if 'contact_name' in brok.data:
+            contact_name = brok.data['contact_name']
+            if contact_name not in self.mapping['user']:
+                logger.debug("Got a brok %s for an unknown user: '%s' (%s)",
+                             brok.type, contact_name, brok.data)
+                return None
+            return 'user', contact_name
+
+        if 'host_name' not in brok.data:
+            return '', ''
+
+        host_name = brok.data['host_name']
+        if host_name not in self.mapping['host']:
+            logger.debug("Got a brok %s for an unknown host: '%s' (%s)",
+                         brok.type, host_name, brok.data)
+            return None
+        if 'service_description' not in brok.data:
+            return 'host', host_name
+
+        service_name = '__'.join([host_name, brok.data['service_description']])
+        if service_name not in self.mapping['service']:
+            logger.debug("Got a brok %s for an unknown service: '%s' (%s)",
+                         brok.type, service_name, brok.data)
+            return None
+        return 'service', service_name
+
+    def get_host_shard(self, host_name):
+        """Get the shard of an host
+
+        The shard is got from a CRC of the host name, so it is the same in all the processes
+
+        :param host_name: the host name
+        :type host_name: str
+        :return: the shard index
+        :rtype: int
+        """
+        return zlib.crc32(host_name.encode('utf-8')) % self.shards
+
+    def in_shard(self, host_name):
+        """Check if an host belongs to the shard managed by the process
+
+        :param host_name: the host name
+        :type host_name: str
+        :return: True if the process manages the host broks
+        :rtype: bool
+        """
+        return self.shard is None or self.get_host_shard(host_name) == self.shard
+
+    def get_brok_shard(self, brok):
+        """Get the shard that manages a brok
+
+        The host broks and the host services broks are managed by the host shard. The other
+        broks (eg. program status, contact status) are managed by the first shard.
+
+        :param brok: a prepared Brok object
+        :type brok: object
+        :return: the shard index
+        :rtype: int
+        """
+        host_name = brok.data.get('host_name', brok.data.get('host'))
+        if not host_name:
+            return 0
+        return self.get_host_shard(host_name)
+
+    def start_shards(self):
+        """Start the shards worker processes
+
+        :return: None
+        """
+        # The worker processes are forked to inherit the module configuration
+        context = multiprocessing.get_context('fork')
+        self.shard_parent = os.getpid()
+        for index in range(self.shards):
+            shard_queue = context.Queue()
+            process = context.Process(target=self.shard_main, args=(index, shard_queue),
+                                      name='%s-shard-%d' % (self.alias, index))
+            process.start()
+            logger.info("Started shard %d (pid=%d)", index, process.pid)
+            self.shard_queues.append(shard_queue)
+            self.shard_processes.append(process)
+
+    def stop_shards(self):
+        """Stop the shards worker processes
+
+        :return: None
+        """
+        for process in self.shard_processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.shard_processes:
+            process.join(timeout=10)
+            if process.is_alive():  # pragma: no cover - should not happen
+                logger.warning("Shard %s is still alive", process.name)
+        self.shard_processes = []
+        self.shard_queues = []
+
+    def shard_main(self, index, shard_queue):
+        """Main function of a shard worker process
+
+        The worker process manages the broks routed by the module process. It has its own
+        backend connection, references, sender workers and spool.
+
+        :param index: shard index
+        :type index: int
+        :param shard_queue: the queue of the broks routed to the shard
+        :type shard_queue: multiprocessing.Queue
+        :return: None
+        """
+        self.shard = index
+        self.to_q = shard_queue
+        # The shards started before this one belong to the module process
+        self.shard_processes = []
+        self.shard_queues = []
+        if self.metrics_dump_file:
+            self.metrics_dump_file = '%s.shard-%d' % (self.metrics_dump_file, index)
+        self.set_proctitle('%s-shard-%d' % (self.alias, index))
+        logger.info("shard %d starting...", index)
+
+        # Do not use the connections opened by the module process
+        self.http_pool.clear()
+        self.backend = self.get_backend()
+        self.sender_pool = None
+        self.sender_backends = []
+        self.spool = None
+        if self.spool_dir:
+            self.spool = Spool(os.path.join(self.spool_dir, 'shard-%d' % index), 'lcr',
+                               segment_size=self.spool_segment_size,
+                               max_size=self.spool_max_size)
+        if self.journal_dir:
+            self.journal = Journal(os.path.join(self.journal_dir, 'shard-%d' % index), 'broker',
+                                   self.journal_fsync_interval)
+        self.logged_in = False
+        self.backend_connected = self.backend_connection()
+
+        self.manage_queue()
+        self.stop()
+
+    def route_broks(self):
+        """Route the broks of the module queue to the shards
+
+        :return: None
+        """
+        self.start_shards()
+
+        while not self.interrupted:
+            try:
+                message = self.to_q.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                message = []
+
+            start = time.time()
+            shards = [[] for _ in range(self.shards)]
+            for brok in message:
+                if brok.type not in self.brok_handlers:
+                    continue
+                if brok.type == 'new_conf':
+                    # All the shards reload their references
+                    for broks in shards:
+                        broks.append(brok)
+                    continue
+                brok.prepare()
+                shards[self.get_brok_shard(brok)].append(brok)
+            for index, broks in enumerate(shards):
+                if broks:
+                    self.shard_queues[index].put(broks)
+            if message:
+                self.statsmgr.timer('routed-broks-time', time.time() - start)
+                self.statsmgr.gauge('routed-broks-count', len(message))
+
+            for index, process in enumerate(self.shard_processes):
+                if not process.is_alive():
+                    logger.error("Shard %d process exited, stopping the module", index)
+                    self.interrupted = True
+
+            self.run_periodic_tasks([self.profiler.check, self.http_pool.check])
+
+        self.stop_shards()
+
     def main(self):
         """
         Main loop of the process
@@ -1055,33 +2450,162 @@ class AlignakBackendBroker(BaseModule):
 
         logger.info("starting...")
 
+        # Do not use the connections opened by the daemon process
+        self.http_pool.clear()
+
+        if self.shards > 1:
+            self.route_broks()
+        else:
+            self.manage_queue()
+        self.stop()
+
+    def stop(self):
+        """Stop the module process activity
+
+        :return: None
+        """
+        logger.info("stopping...")
+        self.profiler.stop()
+        if self.sender_pool is not None:
+            self.sender_pool.shutdown()
+        if self.journal is not None:
+            self.journal.close()
+        logger.info("stopped")
+
+    def manage_queue(self):
+        """Manage the broks of the module queue until the module is interrupted
+
+        :return: None
+        """
+        if self.journal is not None:
+            self.replay_journal()
+
         while not self.interrupted:
+            if self.shard is not None and os.getppid() != self.shard_parent:
+                logger.error("The module process exited, stopping the shard %d", self.shard)
+                break
+
             try:
                 queue_size = self.to_q.qsize()
                 if queue_size:
                     logger.debug("queue length: %s", queue_size)
                     self.statsmgr.gauge('queue-size', queue_size)
 
-                # Reset backend lists
-                self.logcheckresults = []
+                # Reset backend lists. The journaled log check results and live states that
+                # were not sent because the backend is not available are kept to be sent later
+                if self.journal is None:
+                    self.logcheckresults = []
+                    self.livestates = {'host': {}, 'service': {}}
+
+                # Wait for a message and get all the other queued messages, up to the
+                # maximum batch size, to manage them in the same loop turn
+                messages = [self.to_q.get(timeout=self.queue_timeout)]
+                while len(messages) < self.batch_max_messages:
+                    try:
+                        messages.append(self.to_q.get_nowait())
+                    except queue.Empty:
+                        break
 
-                message = self.to_q.get_nowait()
                 start = time.time()
-                for brok in message:
-                    # Prepare and manage each brok in the queue message
-                    brok.prepare()
-                    self.manage_brok(brok)
-                self.statsmgr.gauge('managed-broks-count', len(message))
-
-                logger.debug("time to manage %s broks (%d secs)", len(message), time.time() - start)
+                shedding = self.get_shedding_level(queue_size)
+                broks_count = 0
+                for message in messages:
+                    for brok in message:
+                        if self.shed_brok(brok, shedding):
+                            continue
+                        # Manage each brok in the queue message, the brok is prepared (its
+                        # data are decoded) only if its type is managed by the module
+                        self.manage_brok(brok)
+                    broks_count += len(message)
+                for brok_type, count in self.shed_counts.items():
+                    self.statsmgr.gauge('shed-broks.%s' % brok_type, count)
+                self.statsmgr.gauge('batch-messages-count', len(messages))
+                self.statsmgr.gauge('managed-broks-count', broks_count)
+
+                logger.debug("time to manage %s broks (%d secs)", broks_count, time.time() - start)
                 self.statsmgr.timer('managed-broks-time', time.time() - start)
 
+                if self.journal is not None:
+                    # The pending updates are journaled before being sent
+                    self.sync_journal()
+
+                if self.livestates['host'] or self.livestates['service']:
+                    self.send_to_backend('livestates', None, None)
+
                 if self.logcheckresults:
                     self.send_to_backend('lcrs', None, None)
 
+                if self.journal is not None:
+                    # The journaled updates are sent (or spooled, or failed)
+                    self.limit_pending_lcrs()
+                    self.commit_journal()
+
             except queue.Empty:
                 # logger.debug("No message in the module queue")
-                time.sleep(0.1)
+                pass
+            except Exception as exp:
+                logger.exception("Backend update exception: %s", exp)
 
-        logger.info("stopping...")
-        logger.info("stopped")
+            self.run_periodic_tasks([self.flush_next_checks, self.check_spool,
+                                     self.check_journal, self.check_metrics,
+                                     self.profiler.check, self.http_pool.check])
+
+    @staticmethod
+    def run_periodic_tasks(tasks):
+        """Run the periodic tasks of a module loop turn
+
+        An exception raised by a task (eg. a spool or journal I/O error) is logged, it does not
+        stop the module loop nor the other tasks.
+
+        :param tasks: functions called without parameter
+        :type tasks: list
+        :return: None
+        """
+        for task in tasks:
+            try:
+                task()
+            except Exception as exp:
+                logger.exception("Periodic task %s exception: %s", task.__name__, exp)
+
+    def flush_next_checks(self):
+        """Post the accumulated next checks if the bulk interval elapsed
+
+        :return: None
+        """
+        if (self.next_checks['host'] or self.next_checks['service']) and \
+                time.time() - self.next_checks_flushed >= self.next_check_bulk_interval:
+            self.send_to_backend('next_checks', None, None)
+
+    def check_spool(self):
+        """Drain the spool and send its statistics
+
+        :return: None
+        """
+        if self.spool is None:
+            return
+        self.drain_spool()
+        for key, value in self.spool.get_stats().items():
+            self.statsmgr.gauge('spool-%s' % key, value)
+
+    def check_journal(self):
+        """Sync the journal and send its statistics
+
+        :return: None
+        """
+        if self.journal is None:
+            return
+        self.sync_journal()
+        for key, value in self.journal.get_stats().items():
+            self.statsmgr.gauge('journal-%s' % key, value)
+
+    def check_metrics(self):
+        """Dump the latency histograms if requested, export them if the interval elapsed
+
+        :return: None
+        """
+        if self.metrics_dump_requested:
+            self.dump_metrics()
+        if self.metrics_interval and \
+                time.time() - self.metrics_exported >= self.metrics_interval:
+            self.metrics.export(self.statsmgr)
+            self.metrics_exported = time.time()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the compact objects references used by the broker module
+
+The broker module keeps a reference for each host, service and user of the backend. A
+reference is a `LiveRef` record rather than a dictionary: the record fields are stored in
+slots and the identifiers, realms and states strings are interned so that they are stored
+only once whatever the number of objects referencing them.
+"""
+
+import sys
+from collections.abc import MutableMapping
+
+
+def intern_string(value):
+    """Intern a string value, other values are returned unchanged
+
+    :param value: value to intern
+    :return: the interned value
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class LiveRef(MutableMapping):
+    """A backend object reference
+
+    The reference behaves as the dictionary previously used by the broker module:
+    ref['_etag'], ref['_etag'] = etag, 'initial_state' in ref, ...
+    """
+    __slots__ = ('_id', '_etag', '_realm', 'initial_state', 'initial_state_type')
+
+    def __init__(self, _id, _etag, _realm, initial_state=None, initial_state_type=None):
+        # pylint: disable=too-many-arguments
+        self._id = intern_string(_id)
+        self._etag = _etag
+        self._realm = intern_string(_realm)
+        if initial_state is not None:
+            self.initial_state = intern_string(initial_state)
+        if initial_state_type is not None:
+            self.initial_state_type = intern_string(initial_state_type)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__ or not hasattr(self, key):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, intern_string(value) if key != '_etag' else value)
+
+    def __delitem__(self, key):
+        if key not in self.__slots__ or not hasattr(self, key):
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def get_references_size(*containers):
+    """Get the approximate memory size of some references containers
+
+    The containers are dictionaries of dictionaries (eg. the broker module mapping and
+    ref_live) and each object is counted only once.
+
+    :param containers: the references containers
+    :type containers: dict
+    :return: memory size (bytes)
+    :rtype: int
+    """
+    seen = set()
+    size = 0
+
+    def object_size(obj):
+        """Get the object size if it was not yet counted"""
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+
+    for container in containers:
+        size += object_size(container)
+        for references in container.values():
+            size += object_size(references)
+            for key, value in references.items():
+                size += object_size(key)
+                size += object_size(value)
+                if isinstance(value, LiveRef):
+                    for field in value.values():
+                        size += object_size(field)
+
+    return size
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module is an on-disk spool used by the broker module to store the data that could not
+be sent to the alignak-backend
+
+The spool is a directory of append-only segment files. Each segment file contains
+newline-delimited JSON items. A new segment is started when the current one reaches the
+configured segment size, and the oldest segments are dropped when the spool reaches its
+configured maximum size.
+
+The spool is read from its oldest segment: `read` returns some items and a position that
+must be acknowledged with `ack` once the items are safely stored in the backend. The
+acknowledged position is saved on disk to survive a module restart.
+"""
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class Spool(object):
+    """An append-only and segment-rotated on-disk spool
+    """
+
+    def __init__(self, path, name='spool', segment_size=1048576, max_size=104857600):
+        """Spool initialization
+
+        :param path: spool directory, created if it does not exist
+        :type path: str
+        :param name: spool name, used as a prefix for the segment files
+        :type name: str
+        :param segment_size: maximum size of a segment file (bytes)
+        :type segment_size: int
+        :param max_size: maximum size of the whole spool (bytes)
+        :type max_size: int
+        """
+        self.path = path
+        self.name = name
+        self.segment_size = segment_size
+        self.max_size = max_size
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self.offset_file = os.path.join(self.path, '%s.offset' % self.name)
+
+        # Number of items dropped because the spool was full
+        self.dropped = 0
+
+        # Sorted list of the segments sequence numbers
+        self.segments = sorted(
+            int(filename[len(self.name) + 1:-len('.spool')])
+            for filename in os.listdir(self.path)
+            if filename.startswith('%s-' % self.name) and filename.endswith('.spool'))
+
+        # Read position in the oldest segment
+        self.offset = 0
+        if self.segments and os.path.exists(self.offset_file):
+            try:
+                with open(self.offset_file) as offset_file:
+                    sequence, offset = offset_file.read().split()
+                if int(sequence) == self.segments[0]:
+                    self.offset = int(offset)
+            except (IOError, ValueError) as exp:
+                logger.warning("Invalid spool offset file %s: %s", self.offset_file, exp)
+
+        # Count the pending items
+        self.depth = 0
+        for sequence in self.segments:
+            with open(self.segment_path(sequence), 'rb') as segment:
+                if sequence == self.segments[0]:
+                    segment.seek(self.offset)
+                self.depth += sum(1 for _ in segment)
+        if self.depth:
+            logger.info("Spool %s: %d pending items in %d segments",
+                        self.path, self.depth, len(self.segments))
+
+    def __len__(self):
+        return self.depth
+
+    def segment_path(self, sequence):
+        """Get the file path of a segment
+
+        :param sequence: segment sequence number
+        :type sequence: int
+        :return: segment file path
+        :rtype: str
+        """
+        return os.path.join(self.path, '%s-%012d.spool' % (self.name, sequence))
+
+    @property
+    def size(self):
+        """Get the current spool size
+
+        :return: size of all the segment files (bytes)
+        :rtype: int
+        """
+        return sum(os.path.getsize(self.segment_path(sequence)) for sequence in self.segments)
+
+    def get_stats(self):
+        """Get the spool statistics
+
+        :return: dictionary with the spool depth, size, segments and dropped items count
+        :rtype: dict
+        """
+        return {
+            'depth': self.depth,
+            'size': self.size,
+            'segments': len(self.segments),
+            'dropped': self.dropped
+        }
+
+    def append(self, items):
+        """Append some items to the spool
+
+        :param items: list of JSON serializable items
+        :type items: list
+        :return: number of spooled items
+        :rtype: int
+        """
+        if not items:
+            return 0
+
+        if not self.segments or \
+                os.path.getsize(self.segment_path(self.segments[-1])) >= self.segment_size:
+            self.segments.append(self.segments[-1] + 1 if self.segments else 1)
+
+        lines = [json.dumps(item).encode('utf-8') + b'\n' for item in items]
+        with open(self.segment_path(self.segments[-1]), 'ab') as segment:
+            segment.write(b''.join(lines))
+            segment.flush()
+            os.fsync(segment.fileno())
+        self.depth += len(lines)
+
+        # Drop the oldest segments when the spool is full
+        while len(self.segments) > 1 and self.size > self.max_size:
+            self.drop_segment()
+
+        return len(lines)
+
+    def drop_segment(self):
+        """Drop the oldest segment (and its pending items)
+
+        :return: None
+        """
+        sequence = self.segments[0]
+        with open(self.segment_path(sequence), 'rb') as segment:
+            segment.seek(self.offset)
+            count = sum(1 for _ in segment)
+        logger.warning("Spool %s is full, dropping %d items", self.path, count)
+        self.dropped += count
+        self.depth -= count
+        self.remove_segment()
+
+    def remove_segment(self):
+        """Remove the oldest segment file and reset the read position
+
+        :return: None
+        """
+        sequence = self.segments.pop(0)
+        os.remove(self.segment_path(sequence))
+        self.offset = 0
+        if os.path.exists(self.offset_file):
+            os.remove(self.offset_file)
+
+    def read(self, count):
+        """Read some items from the spool head
+
+        The items are read from the oldest segment only, so less items than requested may
+        be returned even if the spool contains more items.
+
+        :param count: maximum number of items to read
+        :type count: int
+        :return: tuple (list of items, position to acknowledge)
+        :rtype: tuple
+        """
+        items = []
+        if not self.segments:
+            return items, None
+
+        sequence = self.segments[0]
+        lines = 0
+        with open(self.segment_path(sequence), 'rb') as segment:
+            segment.seek(self.offset)
+            while lines < count:
+                line = segment.readline()
+                if not line:
+                    break
+                lines += 1
+                try:
+                    items.append(json.loads(line.decode('utf-8')))
+                except ValueError:
+                    # Partially written line, dropped
+                    logger.warning("Spool %s: ignoring a corrupted item", self.path)
+            position = segment.tell()
+
+        return items, (sequence, position, lines)
+
+    def ack(self, position):
+        """Acknowledge the items read up to the provided position
+
+        :param position: the position returned by `read`
+        :type position: tuple
+        :return: None
+        """
+        if position is None or not self.segments:
+            return
+
+        sequence, offset, count = position
+        if sequence != self.segments[0]:
+            return
+        self.depth = max(0, self.depth - count)
+
+        if offset >= os.path.getsize(self.segment_path(sequence)):
+            # The oldest segment is fully consumed
+            self.remove_segment()
+            return
+
+        self.offset = offset
+        with open(self.offset_file, 'w') as offset_file:
+            offset_file.write('%d %d' % (sequence, offset))
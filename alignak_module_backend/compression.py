@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the request bodies compression used by the backend modules
+
+The big request bodies (eg. log check results, retention data) may be sent compressed
+(gzip or deflate Content-Encoding) to the backend. The backend (or its front web server)
+must support the compressed request bodies.
+
+The requests bodies are serialized here, compressed or not, so that their raw and sent sizes
+are counted in the statistics.
+"""
+
+import gzip
+import json
+import time
+import zlib
+import logging
+
+from alignak_backend_client.client import BackendException
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+ENCODINGS = {
+    'gzip': lambda body: gzip.compress(body, compresslevel=6),
+    'deflate': lambda body: zlib.compress(body, 6)
+}
+
+
+class BodyCompression(object):
+    """Send requests with a compressed body
+    """
+
+    def __init__(self, mod_conf, statsmgr, metrics=None):
+        """Compression initialization
+
+        The compression is configured with the module configuration parameters:
+        - compression: gzip or deflate, default is no compression
+        - compression_threshold: minimum body size to compress (1024 bytes)
+
+        :param mod_conf: module configuration
+        :type mod_conf: alignak.objects.module.Module
+        :param statsmgr: the statistics manager
+        :type statsmgr: alignak.stats.Stats
+        :param metrics: latency histograms of the module, the requests durations are observed
+        in the http.<verb>.<endpoint> histograms
+        :type metrics: alignak_module_backend.broker.metrics.Metrics
+        """
+        self.encoding = getattr(mod_conf, 'compression', '')
+        if self.encoding and self.encoding not in ENCODINGS:
+            logger.warning("Unknown compression: %s, compression is disabled", self.encoding)
+            self.encoding = ''
+        self.threshold = int(getattr(mod_conf, 'compression_threshold', '1024'))
+        self.statsmgr = statsmgr
+        self.metrics = metrics
+        logger.info("request bodies compression: %s, threshold: %d bytes",
+                    self.encoding or 'disabled', self.threshold)
+
+    def send(self, backend, method, endpoint, data, headers=None):
+        """Send a request with a JSON body compressed if it is bigger than the threshold
+
+        The body is not compressed if no compression is configured.
+
+        :param backend: backend client
+        :type backend: Backend
+        :param method: HTTP method
+        :type method: str
+        :param endpoint: backend endpoint
+        :type endpoint: str
+        :param data: request data
+        :type data: dict | list
+        :param headers: request headers
+        :type headers: dict
+        :return: the HTTP response
+        :rtype: requests.Response
+        """
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/json'
+        body = json.dumps(data).encode('utf-8')
+        raw_size = len(body)
+        if self.encoding and raw_size >= self.threshold:
+            body = ENCODINGS[self.encoding](body)
+            headers['Content-Encoding'] = self.encoding
+
+        endpoint_name = endpoint.strip('/').split('/')[0]
+        self.statsmgr.counter('backend-bytes-raw.%s' % endpoint_name, raw_size)
+        self.statsmgr.counter('backend-bytes-wire.%s' % endpoint_name, len(body))
+        logger.debug("%s %s: %d bytes sent for %d bytes", method, endpoint, len(body), raw_size)
+
+        start = time.time()
+        try:
+            return backend.get_response(method=method, endpoint=endpoint, headers=headers,
+                                        data=body)
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('http.%s.%s' % (method.lower(), endpoint_name),
+                                     time.time() - start)
+
+    def post(self, backend, endpoint, data):
+        """Create some items, see Backend.post
+
+        :param backend: backend client
+        :type backend: Backend
+        :param endpoint: backend endpoint
+        :type endpoint: str
+        :param data: item(s) to create
+        :type data: dict | list
+        :return: the backend response
+        :rtype: dict
+        """
+        return backend.decode(self.send(backend, 'POST', endpoint, data))
+
+    def put(self, backend, endpoint, data, headers, inception=False):
+        """Replace an item, see Backend.put
+
+        :param backend: backend client
+        :type backend: Backend
+        :param endpoint: backend endpoint
+        :type endpoint: str
+        :param data: item properties
+        :type data: dict
+        :param headers: request headers, including the If-Match header
+        :type headers: dict
+        :param inception: get the item _etag and retry if the item was modified
+        :type inception: bool
+        :return: the backend response
+        :rtype: dict
+        """
+        response = self.send(backend, 'PUT', endpoint, data, headers)
+        if response.status_code == 412:
+            if not inception:
+                raise BackendException(response.status_code, response.content)
+            item = backend.get(endpoint, params={'projection': json.dumps({'_etag': 1})})
+            headers = dict(headers)
+            headers['If-Match'] = item['_etag']
+            response = self.send(backend, 'PUT', endpoint, data, headers)
+
+        return backend.decode(response)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the on-demand profiler used by the backend modules
+
+A profiling session is requested by creating the configured trigger file (or by a signal
+for the modules that run in their own process). The module loop is then profiled with
+cProfile during the configured duration and the profile is written in a pstats file that
+can be read with the pstats module or converted to a flame graph (eg. flameprof,
+gprof2dot, snakeviz).
+
+When no profiling session is running, the trigger file existence is checked at most once
+per second.
+"""
+
+import os
+import time
+import logging
+import cProfile
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class Profiler(object):
+    """An on-demand cProfile profiler
+    """
+
+    def __init__(self, name, mod_conf):
+        """Profiler initialization
+
+        The profiler is configured with the module configuration parameters:
+        - profile_trigger_file: the file that requests a profiling session (none)
+        - profile_duration: profiling session duration (30 seconds)
+        - profile_dir: directory of the profile dumps (/tmp)
+
+        :param name: module name, used as a prefix for the profile dumps
+        :type name: str
+        :param mod_conf: module configuration
+        :type mod_conf: alignak.objects.module.Module
+        """
+        self.name = name
+        self.trigger_file = getattr(mod_conf, 'profile_trigger_file', '')
+        self.duration = int(getattr(mod_conf, 'profile_duration', '30'))
+        self.dump_dir = getattr(mod_conf, 'profile_dir', '/tmp')
+
+        self.profile = None
+        self.started = 0
+        self.requested = False
+        self.last_check = 0
+
+    def request(self):
+        """Request a profiling session, it will start on the next check
+
+        :return: None
+        """
+        self.requested = True
+
+    def check(self):
+        """Start or stop a profiling session
+
+        This function is to be called on each module loop turn.
+
+        :return: None
+        """
+        now = time.time()
+        if self.profile is not None:
+            if now - self.started >= self.duration:
+                self.stop()
+            return
+
+        if not self.requested and self.trigger_file and now - self.last_check >= 1:
+            self.last_check = now
+            if os.path.exists(self.trigger_file):
+                try:
+                    os.remove(self.trigger_file)
+                except OSError as exp:
+                    logger.warning("Error when removing the profiling trigger file: %s", exp)
+                self.requested = True
+
+        if self.requested:
+            self.start()
+
+    def start(self):
+        """Start a profiling session
+
+        :return: None
+        """
+        self.requested = False
+        logger.warning("%s: profiling for %d seconds...", self.name, self.duration)
+        self.profile = cProfile.Profile()
+        self.started = time.time()
+        try:
+            self.profile.enable()
+        except ValueError as exp:
+            # Another profiler is active
+            logger.error("%s: profiling is not available: %s", self.name, exp)
+            self.profile = None
+
+    def stop(self):
+        """Stop the current profiling session and write the profile dump
+
+        :return: the profile dump file name, None if no profiling session is running
+        :rtype: str
+        """
+        if self.profile is None:
+            return None
+
+        self.profile.disable()
+        filename = os.path.join(self.dump_dir, '%s-%s.pstats'
+                                % (self.name, time.strftime('%Y%m%d-%H%M%S')))
+        try:
+            self.profile.dump_stats(filename)
+            logger.warning("%s: profile written in %s", self.name, filename)
+        except (IOError, OSError) as exp:
+            logger.error("%s: error when writing the profile: %s", self.name, exp)
+            filename = None
+        self.profile = None
+
+        return filename
@@ -28,6 +28,10 @@ from alignak.stats import Stats
 from alignak.basemodule import BaseModule
 from alignak_backend_client.client import Backend, BackendException
 
+from alignak_module_backend.profiler import Profiler
+from alignak_module_backend.session import SessionPool
+from alignak_module_backend.compression import BodyCompression
+
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 for handler in logger.parent.handlers:
     if isinstance(handler, logging.StreamHandler):
@@ -100,7 +104,9 @@ class AlignakBackendScheduler(BaseModule):
 
         self.url = getattr(mod_conf, 'api_url', 'http://localhost:5000')
         logger.info("Alignak backend endpoint: %s", self.url)
-        self.backend = Backend(self.url, self.client_processes)
+        # HTTP connections pool of the backend client
+        self.http_pool = SessionPool(mod_conf, self.statsmgr)
+        self.backend = self.http_pool.attach(Backend(self.url, self.client_processes))
         self.backend.token = getattr(mod_conf, 'token', '')
         self.backend_connected = False
         self.backend_errors_count = 0
@@ -117,6 +123,12 @@ class AlignakBackendScheduler(BaseModule):
         else:
             self.backend_connected = True
 
+        # On-demand profiling of the scheduler loop
+        self.profiler = Profiler(self.alias, mod_conf)
+
+        # Retention request bodies compression
+        self.compression = BodyCompression(mod_conf, self.statsmgr)
+
     # Common functions
     def do_loop_turn(self):
         """This function is called/used when you need a module with
@@ -125,6 +137,17 @@ class AlignakBackendScheduler(BaseModule):
         logger.info("[Backend Scheduler] In loop")
         time.sleep(1)
 
+    def hook_scheduler_tick(self, scheduler):
+        # pylint: disable=unused-argument
+        """Hook in scheduler called on each scheduler loop turn
+
+        :param scheduler: alignak.scheduler.Scheduler
+        :type scheduler: object
+        :return: None
+        """
+        self.profiler.check()
+        self.http_pool.check()
+
     def getToken(self):
         """Authenticate and get the token
 
@@ -263,8 +286,9 @@ class AlignakBackendScheduler(BaseModule):
                     headers['If-Match'] = db_hosts[host]['_etag']
                     try:
                         logger.debug('Host retention data: %s', data_to_save['hosts'][host])
-                        self.backend.put('alignakretention/%s' % (db_hosts[host]['_id']),
-                                         data_to_save['hosts'][host], headers, True)
+                        self.compression.put(self.backend,
+                                             'alignakretention/%s' % (db_hosts[host]['_id']),
+                                             data_to_save['hosts'][host], headers, True)
                     except BackendException as exp:  # pragma: no cover - should not happen
                         logger.error('Put alignakretention error')
                         logger.error('Response: %s', exp.response)
@@ -275,7 +299,8 @@ class AlignakBackendScheduler(BaseModule):
                     # if not host in retention_data, POST
                     try:
                         logger.debug('Host retention data: %s', data_to_save['hosts'][host])
-                        self.backend.post('alignakretention', data=data_to_save['hosts'][host])
+                        self.compression.post(self.backend, 'alignakretention',
+                                              data_to_save['hosts'][host])
                     except BackendException as exp:  # pragma: no cover - should not happen
                         logger.error('Post alignakretention error')
                         logger.error('Response: %s', exp.response)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module contains the HTTP connections pool used by the backend modules
+
+All the backend clients of a module process share the same HTTP adapters, thus the same
+keep-alive connections pool. The pool must be big enough for all the threads that request
+the backend concurrently, else the connections are closed after each request and new ones
+are opened (leaving many sockets in the TIME_WAIT state).
+
+The pool utilisation (connections in use and idle, connections created by the pool,
+requests) is sent as statistics. A connection created by the pool replaces a connection that
+was discarded because the pool was full.
+"""
+
+import time
+import logging
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Same requests retrying as the backend client (eg. 104 - Connection reset by peer)
+RETRY_METHODS = ['POST', 'HEAD', 'GET', 'PUT', 'DELETE', 'PATCH']
+
+
+def get_retry():
+    """Get the requests retrying configuration
+
+    The urllib3 Retry methods parameter was renamed (method_whitelist -> allowed_methods).
+
+    :return: the retrying configuration
+    :rtype: urllib3.util.retry.Retry
+    """
+    try:
+        return Retry(total=5, connect=5, read=5, backoff_factor=0.1,
+                     allowed_methods=RETRY_METHODS)
+    except TypeError:  # pragma: no cover - depends on the urllib3 version
+        # pylint: disable=unexpected-keyword-arg
+        return Retry(total=5, connect=5, read=5, backoff_factor=0.1,
+                     method_whitelist=RETRY_METHODS)
+
+
+class SessionPool(object):
+    """A keep-alive HTTP connections pool shared by the backend clients of a module
+    """
+
+    def __init__(self, mod_conf, statsmgr, workers=1):
+        """Connections pool initialization
+
+        The pool is configured with the module configuration parameters:
+        - http_pool_size: maximum number of kept connections (10)
+        - http_keepalive: keep the connections opened between the requests (1)
+        - http_connect_timeout: connection timeout (10 seconds, 0 for none)
+        - http_read_timeout: response timeout (0 for none)
+        - http_pool_stats_interval: pool statistics period (60 seconds, 0 to disable)
+
+        :param mod_conf: module configuration
+        :type mod_conf: alignak.objects.module.Module
+        :param statsmgr: the statistics manager
+        :type statsmgr: alignak.stats.Stats
+        :param workers: number of threads that use the pool concurrently, the pool size is at
+        least this number
+        :type workers: int
+        """
+        self.pool_size = max(1, int(getattr(mod_conf, 'http_pool_size', '10')), workers)
+        self.keepalive = getattr(mod_conf, 'http_keepalive', '1') == '1'
+        connect_timeout = float(getattr(mod_conf, 'http_connect_timeout', '10'))
+        read_timeout = float(getattr(mod_conf, 'http_read_timeout', '0'))
+        self.timeout = (connect_timeout or None, read_timeout or None)
+        self.stats_interval = int(getattr(mod_conf, 'http_pool_stats_interval', '60'))
+        self.statsmgr = statsmgr
+        logger.info("HTTP connections pool: %d connections, keep-alive: %s, timeouts: %s",
+                    self.pool_size, self.keepalive, self.timeout)
+
+        self.adapters = {}
+        for prefix in ['http://', 'https://']:
+            self.adapters[prefix] = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                                max_retries=get_retry())
+
+        self.exported = time.time()
+        self.connections = 0
+        self.requests = 0
+
+    def attach(self, backend):
+        """Make a backend client use the pooled connections
+
+        :param backend: backend client
+        :type backend: Backend
+        :return: the backend client
+        :rtype: Backend
+        """
+        for prefix, adapter in self.adapters.items():
+            backend.session.mount(prefix, adapter)
+        backend.timeout = self.timeout
+        if not self.keepalive:
+            backend.session.headers['Connection'] = 'close'
+
+        return backend
+
+    def clear(self):
+        """Forget the pooled connections
+
+        This function is to be called in a forked process: the connections opened by the
+        parent process must not be used by its child.
+
+        :return: None
+        """
+        for adapter in self.adapters.values():
+            adapter.poolmanager.clear()
+        self.connections = 0
+        self.requests = 0
+
+    def get_stats(self):
+        """Get the connections pool statistics
+
+        The connections (created by the pool) and requests counts are the totals since the
+        pool creation.
+
+        :return: dictionary with the pool size, the connections in use and idle, the opened
+        connections and the requests counts
+        :rtype: dict
+        """
+        stats = {'size': 0, 'in-use': 0, 'idle': 0, 'connections': 0, 'requests': 0}
+        for adapter in self.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None or pool.pool is None:
+                    continue
+                stats['size'] += pool.pool.maxsize
+                stats['in-use'] += pool.pool.maxsize - pool.pool.qsize()
+                stats['idle'] += len([conn for conn in list(pool.pool.queue) if conn is not None])
+                stats['connections'] += pool.num_connections
+                stats['requests'] += pool.num_requests
+
+        return stats
+
+    def export(self):
+        """Send the connections pool statistics
+
+        :return: dictionary with the pool statistics
+        :rtype: dict
+        """
+        stats = self.get_stats()
+        # The totals decrease if a pool was removed
+        new_connections = stats['connections'] - self.connections
+        if new_connections < 0:
+            new_connections = stats['connections']
+        requests = stats['requests'] - self.requests
+        if requests < 0:
+            requests = stats['requests']
+        self.connections = stats['connections']
+        self.requests = stats['requests']
+
+        self.statsmgr.gauge('http-pool.size', stats['size'])
+        self.statsmgr.gauge('http-pool.in-use', stats['in-use'])
+        self.statsmgr.gauge('http-pool.idle', stats['idle'])
+        self.statsmgr.gauge('http-pool.utilization',
+                            100 * stats['in-use'] // stats['size'] if stats['size'] else 0)
+        self.statsmgr.counter('http-pool.new-connections', new_connections)
+        self.statsmgr.counter('http-pool.requests', requests)
+        logger.debug("HTTP connections pool: %s, %d new connections for %d requests",
+                     stats, new_connections, requests)
+
+        return stats
+
+    def check(self):
+        """Send the connections pool statistics if the statistics period elapsed
+
+        This function is to be called on each module loop turn.
+
+        :return: None
+        """
+        if self.stats_interval and time.time() - self.exported >= self.stats_interval:
+            self.exported = time.time()
+            self.export()
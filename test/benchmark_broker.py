@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Offline benchmark of the backend broker module
+
+The broker module is driven with a synthetic broks stream against an in-process fake
+backend client (no uwsgi / MongoDB / alignak-backend needed). The fake backend simulates
+a configurable latency for each request.
+
+Usage:
+    python benchmark_broker.py [--hosts 100] [--services 10] [--broks 20000]
+                               [--message-size 100] [--latency 0.001]
+                               [--mix check_result=50,next_schedule=30,status=15,action=5]
+                               [--mode manage_brok|main] [--tracemalloc]
+                               [--option sender_workers=4 ...]
+
+Eg. compare the next schedule broks management with and without the bulk next checks:
+    python benchmark_broker.py --mix next_schedule=1
+    python benchmark_broker.py --mix next_schedule=1 \\
+        --option next_check_bulk_endpoint=livestatenextcheck --option next_check_bulk_interval=5
+
+Reported: broks/s, per brok p50/p99 latency (manage_brok mode), per message flush
+p50/p99 latency, allocated memory (tracemalloc) and the backend requests count per
+verb / endpoint.
+"""
+
+import sys
+import time
+import queue
+import random
+import logging
+import argparse
+import threading
+import tracemalloc
+
+from alignak.brok import Brok
+
+from fakes import FakeBackend, get_check_result, get_module as get_fake_module
+
+
+def get_broks(args):
+    """Get a list of synthetic broks"""
+    weights = {}
+    for item in args.mix.split(','):
+        kind, weight = item.split('=')
+        weights[kind.strip()] = int(weight)
+    kinds = list(weights)
+
+    rnd = random.Random(args.seed)
+    now = int(time.time())
+    broks = []
+    for _ in range(args.broks):
+        host = 'host%d' % rnd.randrange(args.hosts)
+        service = ''
+        if args.services and rnd.random() > 0.1:
+            service = 'service%d' % rnd.randrange(args.services)
+        kind = rnd.choices(kinds, [weights[kind] for kind in kinds])[0]
+        if kind == 'check_result':
+            brok_type, data = get_check_result(host, service, now)
+        elif kind == 'next_schedule':
+            brok_type = 'service_next_schedule' if service else 'host_next_schedule'
+            data = {'host_name': host, 'next_chk': now + rnd.randrange(300)}
+        elif kind == 'status':
+            brok_type = 'update_service_status' if service else 'update_host_status'
+            data = {'host_name': host, 'active_checks_enabled': rnd.random() > 0.5,
+                    'passive_checks_enabled': True}
+        elif kind == 'action':
+            brok_type = rnd.choice(['acknowledge_raise', 'downtime_raise'])
+            data = {'host': host, 'comment': 'benchmark', 'author': 'admin', 'sticky': 2,
+                    'notify': True, 'start_time': now, 'end_time': now + 3600,
+                    'fixed': True, 'duration': 3600}
+            if service:
+                data['service'] = service
+        else:
+            raise ValueError("Unknown brok kind: %s" % kind)
+        if service and 'host_name' in data:
+            data['service_description'] = service
+        broks.append(Brok({'type': brok_type, 'data': data}))
+
+    return [broks[index:index + args.message_size]
+            for index in range(0, len(broks), args.message_size)]
+
+
+def get_module(args):
+    """Get a broker module using the fake backend"""
+    options = dict(option.split('=', 1) for option in args.option)
+    FakeBackend.record = False
+    return get_fake_module(args.hosts, args.services, latency=args.latency, **options)
+
+
+def flush(module):
+    """Send the pending data to the backend, as the module main loop does"""
+    if module.livestates['host'] or module.livestates['service']:
+        module.send_to_backend('livestates', None, None)
+    if module.logcheckresults:
+        module.send_to_backend('lcrs', None, None)
+    if (module.next_checks['host'] or module.next_checks['service']) and \
+            time.time() - module.next_checks_flushed >= module.next_check_bulk_interval:
+        module.send_to_backend('next_checks', None, None)
+    module.logcheckresults = []
+    module.livestates = {'host': {}, 'service': {}}
+
+
+def percentile(values, percent):
+    """Get a percentile of a list of values"""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def run_manage_brok(module, messages):
+    """Manage the broks with manage_brok and flush the data after each message"""
+    brok_times = []
+    flush_times = []
+    for message in messages:
+        for brok in message:
+            start = time.perf_counter()
+            module.manage_brok(brok)
+            brok_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        flush(module)
+        flush_times.append(time.perf_counter() - start)
+    return brok_times, flush_times
+
+
+def run_main(module, messages):
+    """Manage the broks with the module main loop"""
+    module.to_q = queue.Queue()
+    for message in messages:
+        module.to_q.put(message)
+
+    def stop():
+        """Stop the module when its queue is empty"""
+        while not module.to_q.empty():
+            time.sleep(0.01)
+        module.interrupted = True
+
+    stopper = threading.Thread(target=stop)
+    stopper.start()
+    module.main()
+    stopper.join()
+    return [], []
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--hosts', type=int, default=100)
+    parser.add_argument('--services', type=int, default=10, help="services per host")
+    parser.add_argument('--broks', type=int, default=20000)
+    parser.add_argument('--message-size', type=int, default=100,
+                        help="broks per queue message")
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help="backend request latency (seconds)")
+    parser.add_argument('--mix', default='check_result=50,next_schedule=30,status=15,action=5',
+                        help="broks kinds weights: check_result, next_schedule, status, action")
+    parser.add_argument('--mode', choices=['manage_brok', 'main'], default='manage_brok')
+    parser.add_argument('--option', action='append', default=[],
+                        help="module option, as key=value")
+    parser.add_argument('--tracemalloc', action='store_true', help="trace the allocations")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger('alignak').setLevel(logging.ERROR)
+
+    module = get_module(args)
+    messages = get_broks(args)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if args.mode == 'main':
+        brok_times, flush_times = run_main(module, messages)
+    else:
+        brok_times, flush_times = run_manage_brok(module, messages)
+    duration = time.perf_counter() - start
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print("%d broks (%d messages) managed in %.3f s: %.0f broks/s"
+          % (args.broks, len(messages), duration, args.broks / duration))
+    if brok_times:
+        print("manage_brok latency: p50 %.1f us, p99 %.1f us"
+              % (percentile(brok_times, 50) * 1e6, percentile(brok_times, 99) * 1e6))
+    if flush_times:
+        print("flush latency: p50 %.2f ms, p99 %.2f ms"
+              % (percentile(flush_times, 50) * 1e3, percentile(flush_times, 99) * 1e3))
+    if args.tracemalloc:
+        print("allocated memory: current %.1f KB, peak %.1f KB (%.0f bytes per brok)"
+              % (current / 1024.0, peak / 1024.0, float(peak) / args.broks))
+    print("backend requests: %d" % sum(FakeBackend.requests.values()))
+    for request, count in sorted(FakeBackend.requests.items()):
+        print("- %s: %d" % (request, count))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Test doubles shared by the tests that do not need a running alignak backend
+
+The broker module is built with `get_module`, its backend clients are `FakeBackend`
+in-process stand-ins for the alignak backend client.
+"""
+
+import copy
+import gzip
+import json
+import time
+import zlib
+import queue
+import threading
+from datetime import datetime
+from collections import Counter
+
+import requests
+
+from alignak.objects.module import Module
+from alignak_backend_client.client import BackendException
+
+import alignak_module_backend.broker.module as broker_module
+
+BACKEND_DATE = 'Mon, 01 Jan 2018 00:00:00 GMT'
+BACKEND_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+class FakeStats(object):
+    """Statistics manager that stores the sent statistics
+
+    The gauges and timers keep their last value, the counters are summed.
+    """
+    def __init__(self):
+        self.stats = {}
+
+    def gauge(self, key, value):
+        self.stats[key] = value
+
+    def timer(self, key, value):
+        self.stats[key] = value
+
+    def counter(self, key, value):
+        self.stats[key] = self.stats.get(key, 0) + value
+
+
+class FakeResponse(object):
+    """HTTP response of the fake backend"""
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def json(self):
+        return self.content
+
+
+class FakeBackend(object):
+    """In-process stand-in for the alignak backend client
+
+    All the fake backend clients share the same items store. Each request waits for the
+    configured latency and is recorded in the requests history (if `record` is set). When the
+    backend is not available, all the requests raise a BackendException.
+    """
+    latency = 0.0
+    record = True
+    available = True
+    items = {}
+    requests = Counter()
+    history = []
+    lock = threading.Lock()
+
+    def __init__(self, url, processes=1):
+        self.url = url
+        self.processes = processes
+        self.token = ''
+        self.etag = 0
+        # Used by the module HTTP connections pool
+        self.session = requests.Session()
+        self.timeout = None
+
+    @classmethod
+    def populate(cls, hosts, services):
+        """Create the backend items"""
+        cls.items = {
+            'realm': {'r1': {'_id': 'r1', '_etag': 'e', 'name': 'All'}},
+            'user': {'u1': {'_id': 'u1', '_etag': 'e', '_realm': 'r1', 'name': 'admin',
+                            'is_admin': True, 'host_notifications_enabled': True,
+                            'service_notifications_enabled': True,
+                            '_updated': BACKEND_DATE, '_is_template': False}},
+            'host': {},
+            'service': {},
+            'alignak': {}
+        }
+        for host in range(hosts):
+            host_id = 'h%d' % host
+            cls.items['host'][host_id] = {
+                '_id': host_id, '_etag': 'e', '_realm': 'r1', 'name': 'host%d' % host,
+                'ls_state': 'UP', 'ls_state_type': 'HARD', 'active_checks_enabled': True,
+                'passive_checks_enabled': True, 'ls_next_check': 0,
+                '_updated': BACKEND_DATE, '_is_template': False
+            }
+            for service in range(services):
+                service_id = 's%d_%d' % (host, service)
+                cls.items['service'][service_id] = {
+                    '_id': service_id, '_etag': 'e', '_realm': 'r1', 'host': host_id,
+                    'name': 'service%d' % service,
+                    'ls_state': 'OK', 'ls_state_type': 'HARD', 'active_checks_enabled': True,
+                    'passive_checks_enabled': True, 'ls_next_check': 0,
+                    '_updated': BACKEND_DATE, '_is_template': False
+                }
+        cls.available = True
+        cls.reset()
+
+    @classmethod
+    def reset(cls):
+        """Forget the requests sent to the backend"""
+        cls.requests = Counter()
+        cls.history = []
+
+    @classmethod
+    def sent(cls, verb, endpoint=None):
+        """Get the recorded requests of a verb (and endpoint)"""
+        return [request for request in cls.history if request[0] == verb and
+                (endpoint is None or request[1] == endpoint)]
+
+    def _request(self, verb, endpoint, data=None, headers=None):
+        """Count and record a request and wait for the backend latency"""
+        endpoint = endpoint.strip('/')
+        with self.lock:
+            self.requests['%s %s' % (verb, endpoint.split('/')[0])] += 1
+            if self.record:
+                self.history.append((verb, endpoint, copy.deepcopy(data), dict(headers or {})))
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.available:
+            raise BackendException(1000, 'Backend not available')
+        return endpoint
+
+    @staticmethod
+    def _project(item, params):
+        """Get a copy of an item with the fields of the request projection"""
+        item = copy.deepcopy(item)
+        if params and 'projection' in params:
+            fields = set(json.loads(params['projection'])) | set(['_id', '_etag'])
+            item = dict((key, value) for key, value in item.items() if key in fields)
+        return item
+
+    def login(self, username, password, generate='enabled', proxies=None):
+        # pylint: disable=unused-argument
+        """Log in"""
+        self._request('POST', 'login')
+        self.token = 'token'
+        return True
+
+    def get(self, endpoint, params=None):
+        """Get an item or the first page of an endpoint"""
+        endpoint = self._request('GET', endpoint, params)
+        if endpoint == 'user' and 'token' in (params or {}).get('where', ''):
+            return {'_items': [{'_id': 'u1', 'can_update_livestate': True}]}
+        endpoint, _, item_id = endpoint.partition('/')
+        if not item_id:
+            items = list(self.items[endpoint].values())
+            return {'_items': copy.deepcopy(items[:1]), '_meta': {'total': len(items)}}
+        return self._project(self.items[endpoint][item_id], params)
+
+    def get_all(self, endpoint, params=None):
+        """Get all the items of an endpoint, filtered on their fields and update date"""
+        self._request('GET', endpoint, params)
+        where = json.loads((params or {}).get('where', '{}'))
+        updated = where.pop('_updated', None)
+        items = [item for item in self.items.get(endpoint, {}).values()
+                 if all(item.get(key) == value for key, value in where.items())]
+        if updated:
+            since = datetime.strptime(updated['$gte'], BACKEND_DATE_FORMAT)
+            items = [item for item in items
+                     if datetime.strptime(item['_updated'], BACKEND_DATE_FORMAT) >= since]
+        return {'_status': 'OK', '_items': [self._project(item, params) for item in items]}
+
+    def post(self, endpoint, data, files=None, headers=None):
+        # pylint: disable=unused-argument
+        """Create some items, or update the next checks (bulk next checks endpoint)"""
+        self._request('POST', endpoint, data, headers)
+        if isinstance(data, list) and data and 'item_type' in data[0]:
+            updated = []
+            with self.lock:
+                for next_check in data:
+                    item = self.items[next_check['item_type']][next_check['item_id']]
+                    self.etag += 1
+                    item['ls_next_check'] = next_check['ls_next_check']
+                    item['_etag'] = '%s-%d' % (id(self), self.etag)
+                    updated.append({'_status': 'OK', '_id': item['_id'], '_etag': item['_etag']})
+            return {'_status': 'OK', '_items': updated}
+        return {'_status': 'OK', '_id': 'new', '_etag': 'new'}
+
+    def patch(self, endpoint, data, headers=None, inception=False):
+        """Update an item"""
+        endpoint = self._request('PATCH', endpoint, data, headers)
+        endpoint, _, item_id = endpoint.partition('/')
+        with self.lock:
+            item = self.items[endpoint][item_id]
+            if (headers or {}).get('If-Match') != item['_etag']:
+                if not inception:
+                    raise BackendException(412, 'Precondition failed')
+            self.etag += 1
+            item.update(data)
+            item['_etag'] = '%s-%d' % (id(self), self.etag)
+            return {'_status': 'OK', '_id': item_id, '_etag': item['_etag']}
+
+    def get_response(self, method, endpoint, headers=None, data=None, **kwargs):
+        # pylint: disable=unused-argument
+        """Send a request with a JSON body, maybe compressed"""
+        encoding = (headers or {}).get('Content-Encoding')
+        if encoding == 'gzip':
+            data = gzip.decompress(data)
+        elif encoding == 'deflate':
+            data = zlib.decompress(data)
+        request = getattr(FakeBackend, method.lower())
+        return FakeResponse(request(self, endpoint, json.loads(data.decode('utf-8')),
+                                    headers=headers))
+
+    @staticmethod
+    def decode(response):
+        """Get the response content"""
+        return response.json()
+
+    def put(self, endpoint, data, headers=None, inception=False):
+        # pylint: disable=unused-argument
+        """Replace an item"""
+        self._request('PUT', endpoint, data, headers)
+        return {'_status': 'OK'}
+
+
+def get_check_result(host, service, now):
+    """Get a check result brok data"""
+    data = {
+        'host_name': host, 'state': 'OK', 'state_type': 'HARD', 'state_id': 0,
+        'passive_check': False, 'problem_has_been_acknowledged': False,
+        'acknowledgement_type': 1, 'in_scheduled_downtime': False, 'last_chk': now,
+        'last_state': 'OK', 'last_state_id': 0, 'last_state_type': 'HARD',
+        'output': 'Check output for %s/%s' % (host, service), 'long_output': '',
+        'perf_data': 'time=0.012s;1;2;0 size=1234B;;;0', 'latency': 0.1,
+        'execution_time': 0.012, 'attempt': 1, 'last_state_change': now - 3600,
+        'last_hard_state_change': now - 3600, 'last_time_unreachable': 0
+    }
+    if service:
+        data.update({'service_description': service, 'last_time_ok': now,
+                     'last_time_warning': 0, 'last_time_critical': 0,
+                     'last_time_unknown': 0})
+        return 'service_check_result', data
+    data.update({'last_time_up': now, 'last_time_down': 0})
+    return 'host_check_result', data
+
+
+def get_module(hosts=2, services=2, latency=0.0, available=True, load_refs=True, **options):
+    """Get a broker module using the fake backend and the fake statistics manager
+
+    :param hosts: number of backend hosts
+    :param services: number of backend services per host
+    :param latency: backend requests latency (seconds)
+    :param available: the backend is available when the module starts
+    :param load_refs: load the backend references (the backend must be available)
+    :param options: module configuration options
+    :return: the broker module
+    """
+    broker_module.Backend = FakeBackend
+    FakeBackend.latency = latency
+    FakeBackend.populate(hosts, services)
+    FakeBackend.available = available
+
+    configuration = {
+        'module_alias': 'backend_broker',
+        'module_types': 'backend_broker',
+        'python_name': 'alignak_module_backend.broker',
+        'log_level': 'ERROR',
+        'api_url': 'http://127.0.0.1:5000',
+        'username': 'admin',
+        'password': 'admin'
+    }
+    configuration.update(options)
+    module = broker_module.AlignakBackendBroker(Module(configuration))
+    module.statsmgr = FakeStats()
+    for user in [module.breaker, module.compression, module.http_pool]:
+        user.statsmgr = module.statsmgr
+    if load_refs:
+        module.get_refs()
+    FakeBackend.reset()
+    return module
+
+
+def run_queue(module, messages):
+    """Manage some queue messages with the module main loop, then stop the loop
+
+    :param module: the broker module
+    :param messages: list of queue messages (lists of broks)
+    :return: None
+    """
+    module.to_q = queue.Queue()
+    for message in messages:
+        module.to_q.put(message)
+
+    stopped = threading.Event()
+
+    def stop():
+        """Stop the module loop when its queue is empty"""
+        while not module.to_q.empty() and not stopped.is_set():
+            time.sleep(0.01)
+        module.interrupted = True
+
+    module.interrupted = False
+    module.queue_timeout = 0.1
+    stopper = threading.Thread(target=stop)
+    stopper.start()
+    try:
+        module.manage_queue()
+    finally:
+        stopped.set()
+        stopper.join()
@@ -142,6 +142,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         self.assertEqual(len(actionack['_items']), 1)
@@ -171,6 +172,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         self.assertEqual(len(actionack['_items']), 1)
@@ -202,6 +204,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         self.assertEqual(len(actionack['_items']), 0)
@@ -248,6 +251,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         self.assertEqual(len(actionack['_items']), 1)
@@ -290,6 +294,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         self.assertEqual(len(actionack['_items']), 1)
@@ -323,6 +328,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         self.assertEqual(len(actionack['_items']), 0)
@@ -356,6 +362,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         self.assertEqual(len(actionack['_items']), 1)
@@ -387,6 +394,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actionack = self.backend.get_all('actionacknowledge')
         actionack = self.backend.get('actionacknowledge')
@@ -448,6 +456,7 @@ class TestBrokerAckDowntime(unittest2.TestCase):
         b.prepare()
         self.brokmodule.get_refs()
         self.brokmodule.manage_brok(b)
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         actiondowntime = self.backend.get_all('actiondowntime')
         self.assertEqual(len(actiondowntime['_items']), 1)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest2
+
+from alignak.brok import Brok
+
+from fakes import FakeBackend, get_module
+
+
+def add_user(user_id, name):
+    """Add an user in the backend, not in the module references"""
+    FakeBackend.items['user'][user_id] = {'_id': user_id, '_etag': 'e', '_realm': 'r1',
+                                          'name': name}
+
+
+class TestBrokerAuthors(unittest2.TestCase):
+
+    def test_01_references(self):
+        """The authors are got from the users references, then from the backend
+
+        :return: None
+        """
+        module = get_module()
+        brok = Brok({'type': 'acknowledge_raise',
+                     'data': {'host': 'host0', 'author': 'admin', 'comment': 'Ack',
+                              'sticky': 2, 'notify': True}})
+        assert module.manage_brok(brok) is True
+        assert FakeBackend.sent('POST', 'actionacknowledge')[0][2]['user'] == 'u1'
+        assert FakeBackend.sent('GET', 'user') == []
+
+        add_user('u2', 'other')
+        for _ in range(3):
+            assert module.get_author_id('other') == 'u2'
+        assert len(FakeBackend.sent('GET', 'user')) == 1
+
+        # An unknown author is replaced with the admin user
+        for _ in range(3):
+            assert module.get_author_id('unknown') == 'u1'
+        assert len(FakeBackend.sent('GET', 'user')) == 2
+
+        # The cache is cleared when the references are reloaded
+        module.last_load = 0
+        module.get_refs()
+        FakeBackend.reset()
+        assert module.authors_cache == {}
+        assert module.get_author_id('other') == 'u2'
+        assert len(FakeBackend.sent('GET', 'user')) == 1
+
+    def test_02_lru(self):
+        """The least recently used authors are removed from the cache
+
+        :return: None
+        """
+        module = get_module(authors_cache_size='2')
+        for index in range(3):
+            add_user('u%d' % (index + 2), 'user%d' % index)
+        module.get_author_id('user0')
+        module.get_author_id('user1')
+        # Used, then user1 is the least recently used author
+        module.get_author_id('user0')
+        module.get_author_id('user2')
+        assert list(module.authors_cache) == ['user0', 'user2']
+        assert len(FakeBackend.sent('GET', 'user')) == 3
+
+        assert module.get_author_id('user1') == 'u3'
+        assert list(module.authors_cache) == ['user2', 'user1']
+        assert len(FakeBackend.sent('GET', 'user')) == 4
+
+    def test_03_admin(self):
+        """The admin user is got once from the backend if it is not in the references
+
+        :return: None
+        """
+        module = get_module()
+        del module.mapping['user']['admin']
+        assert module.get_author_id('unknown0') == 'u1'
+        assert module.get_author_id('unknown1') == 'u1'
+        # The two unknown authors and the admin user
+        assert len(FakeBackend.sent('GET', 'user')) == 3
+        assert module.admin_user_id == 'u1'
+
+        module.last_load = 0
+        module.get_refs()
+        assert module.admin_user_id is None
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest2
+
+from alignak_module_backend.broker.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+from fakes import FakeStats
+
+
+class TestCircuitBreaker(unittest2.TestCase):
+
+    def test_01_states(self):
+        """The circuit is opened on a failure and a single probe is allowed after the delay
+
+        :return: None
+        """
+        statsmgr = FakeStats()
+        breaker = CircuitBreaker(statsmgr, min_delay=0.1, max_delay=0.4, jitter=0)
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+        breaker.failure()
+        assert breaker.state == OPEN
+        assert statsmgr.stats['backend-breaker-state'] == OPEN
+        assert not breaker.allow()
+        # Other failures while the circuit is open are ignored
+        breaker.failure()
+        assert breaker.failures == 1
+
+        time.sleep(0.1)
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert statsmgr.stats['backend-breaker-state'] == HALF_OPEN
+        # Only one probe
+        assert not breaker.allow()
+
+        # The probe fails, the delay doubles
+        breaker.failure()
+        assert breaker.state == OPEN
+        assert 0.15 < breaker.retry_at - time.time() <= 0.2
+
+        time.sleep(0.2)
+        assert breaker.allow()
+        breaker.success()
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+        assert statsmgr.stats['backend-breaker-state'] == CLOSED
+        assert statsmgr.stats['backend-breaker-open'] == 2
+
+    def test_02_backoff(self):
+        """The retry delay grows exponentially up to the maximum delay, with a jitter
+
+        :return: None
+        """
+        breaker = CircuitBreaker(FakeStats(), min_delay=1, max_delay=60, jitter=0)
+        delays = []
+        for failures in range(1, 9):
+            breaker.failures = failures
+            delays.append(breaker.get_delay())
+        assert delays == [1, 2, 4, 8, 16, 32, 60, 60]
+
+        breaker = CircuitBreaker(FakeStats(), min_delay=10, max_delay=60, jitter=0.5)
+        breaker.failures = 2
+        delays = [breaker.get_delay() for _ in range(100)]
+        assert all(10 <= delay <= 20 for delay in delays)
+        assert len(set(delays)) > 1
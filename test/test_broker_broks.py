@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest2
+
+from alignak.brok import Brok
+
+from fakes import FakeBackend, get_check_result, get_module, run_queue
+
+
+def get_brok(brok_type, host, **data):
+    """Get a brok for an host"""
+    data['host_name'] = host
+    return Brok({'type': brok_type, 'data': data})
+
+
+def check_result(host):
+    """Get an host check result brok"""
+    brok_type, data = get_check_result(host, '', int(time.time()))
+    return Brok({'type': brok_type, 'data': data})
+
+
+class TestBrokerShedding(unittest2.TestCase):
+
+    def test_01_levels(self):
+        """The shedding level depends on the module queue size
+
+        :return: None
+        """
+        module = get_module(queue_high_water='2')
+        assert [module.get_shedding_level(size) for size in range(6)] == [0, 0, 1, 1, 2, 2]
+        assert module.statsmgr.stats['shedding-level'] == 2
+
+        next_schedule = get_brok('host_next_schedule', 'host0', next_chk=100)
+        status = get_brok('update_host_status', 'host0', active_checks_enabled=False)
+        result = check_result('host0')
+        assert [module.shed_brok(brok, 0) for brok in [next_schedule, status, result]] == \
+            [False, False, False]
+        assert [module.shed_brok(brok, 1) for brok in [next_schedule, status, result]] == \
+            [True, False, False]
+        assert [module.shed_brok(brok, 2) for brok in [next_schedule, status, result]] == \
+            [True, True, False]
+        assert module.shed_counts == {'host_next_schedule': 2, 'update_host_status': 1}
+
+        # Shedding disabled
+        module = get_module()
+        assert module.get_shedding_level(1000) == 0
+
+    def test_02_max_age(self):
+        """The too old broks are dropped as with the first shedding level
+
+        :return: None
+        """
+        module = get_module(queue_max_age='60')
+        next_schedule = get_brok('host_next_schedule', 'host0', next_chk=100)
+        status = get_brok('update_host_status', 'host0', active_checks_enabled=False)
+        assert not module.shed_brok(next_schedule, 0)
+        next_schedule.creation_time -= 120
+        status.creation_time -= 120
+        assert module.shed_brok(next_schedule, 0)
+        assert not module.shed_brok(status, 0)
+
+    def test_03_main_loop(self):
+        """The main loop drops the broks when its queue is overloaded
+
+        :return: None
+        """
+        module = get_module(queue_high_water='2')
+        messages = [[get_brok('host_next_schedule', 'host0', next_chk=100 + index),
+                     check_result('host0')] for index in range(3)]
+        run_queue(module, messages)
+        assert FakeBackend.sent('PATCH') == []
+        assert len(FakeBackend.sent('POST', 'logcheckresult')[0][2]) == 3
+        assert module.statsmgr.stats['shed-broks.host_next_schedule'] == 3
+
+
+class TestBrokerFiltering(unittest2.TestCase):
+
+    def test_01_allow(self):
+        """Only the allowed broks types are managed
+
+        :return: None
+        """
+        module = get_module(broks_allow='host_check_result, update_host_status')
+        assert sorted(module.brok_handlers) == ['host_check_result', 'update_host_status']
+        assert module.manage_brok(get_brok('host_next_schedule', 'host0', next_chk=100)) \
+            is False
+        assert module.livestates['host'] == {}
+        module.manage_brok(check_result('host0'))
+        assert len(module.logcheckresults) == 1
+
+    def test_02_deny(self):
+        """The denied broks types are ignored
+
+        :return: None
+        """
+        module = get_module(broks_deny='host_next_schedule')
+        assert 'host_next_schedule' not in module.brok_handlers
+        assert 'service_next_schedule' in module.brok_handlers
+        assert module.manage_brok(get_brok('host_next_schedule', 'host0', next_chk=100)) \
+            is False
+        assert module.livestates['host'] == {}
+
+        # Denied even if allowed
+        module = get_module(broks_allow='host_next_schedule,host_check_result',
+                            broks_deny='host_next_schedule')
+        assert sorted(module.brok_handlers) == ['host_check_result']
+
+    def test_03_sampling(self):
+        """Only one sampled brok is managed for an object during the sampling delay
+
+        :return: None
+        """
+        module = get_module(broks_sampling='update_host_status:60, invalid, '
+                                           'acknowledge_raise:60, new_conf:60')
+        # The broks that do not concern an object are not sampled
+        assert module.broks_sampling == {'update_host_status': 60}
+
+        for active in [False, True]:
+            for host in ['host0', 'host1']:
+                module.manage_brok(get_brok('update_host_status', host,
+                                            active_checks_enabled=active))
+        assert sorted(request[1] for request in FakeBackend.sent('PATCH')) == \
+            ['host/h0', 'host/h1']
+        assert module.statsmgr.stats['sampled-broks-dropped.update_host_status'] == 2
+
+        # The delay elapsed
+        module.broks_sampled['update_host_status']['host0'] -= 60
+        module.manage_brok(get_brok('update_host_status', 'host0', active_checks_enabled=True))
+        assert len(FakeBackend.sent('PATCH', 'host/h0')) == 2
+
+        # The other broks types are not sampled
+        for next_check in [100, 200]:
+            module.manage_brok(get_brok('host_next_schedule', 'host0', next_chk=next_check))
+        assert module.livestates['host']['host0'] == {'ls_next_check': 200}
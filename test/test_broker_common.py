@@ -373,6 +373,10 @@ class TestBrokerCommon(unittest2.TestCase):
         b = Brok({'data': data, 'type': 'host_next_schedule'}, False)
         b.prepare()
         assert self.brokmodule.manage_brok(b) is True
+        # Check the live states prepared list
+        assert len(self.brokmodule.livestates['host']) == 1
+        # Send data to the backend
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         params = {'where': '{"name": "srv001"}'}
         r = self.backend.get('host', params)
@@ -898,6 +902,10 @@ class TestBrokerCommon(unittest2.TestCase):
         b = Brok({'data': data, 'type': 'service_next_schedule'}, False)
         b.prepare()
         assert self.brokmodule.manage_brok(b) is True
+        # Check the live states prepared list
+        assert len(self.brokmodule.livestates['service']) == 1
+        # Send data to the backend
+        self.brokmodule.send_to_backend('livestates', '', '')
 
         params = {'where': '{"name": "ping"}'}
         r = self.backend.get('service', params)
@@ -1012,6 +1020,8 @@ class TestBrokerCommon(unittest2.TestCase):
             b = Brok({'data': data, 'type': 'service_next_schedule'}, False)
             b.prepare()
             assert self.brokmodule.manage_brok(b) is True
+            # Send data to the backend
+            self.brokmodule.send_to_backend('livestates', '', '')
 
             params = {'where': '{"name": "ping"}'}
             r = self.backend.get('service', params)
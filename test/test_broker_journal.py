@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import shutil
+import tempfile
+import unittest2
+
+from alignak.brok import Brok
+
+from alignak_module_backend.broker.journal import Journal
+
+from fakes import FakeBackend, get_check_result, get_module, run_queue
+
+
+class TestBrokerJournal(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_01_replay(self):
+        """The records not committed are replayed after a restart
+
+        :return: None
+        """
+        journal = Journal(self.path, 'broker', fsync_interval=60)
+        assert journal.read() == []
+        journal.append(['lcr', {'host_name': 'host0'}])
+        journal.append(['ls', 'host', 'host0', {'ls_next_check': 10}])
+        assert len(journal) == 2
+        # Written but not fsynced
+        assert journal.sync() is False
+        assert journal.fsyncs == 0
+
+        # Restart without closing the journal (crash)
+        journal = Journal(self.path, 'broker')
+        assert journal.read() == [['lcr', {'host_name': 'host0'}],
+                                  ['ls', 'host', 'host0', {'ls_next_check': 10}]]
+        # Returned only once
+        assert journal.read() == []
+
+        # The records are committed, a still pending record is kept
+        journal.commit([['ls', 'host', 'host1', {'ls_next_check': 20}]])
+        assert len(journal) == 1
+        journal.close()
+
+        journal = Journal(self.path, 'broker')
+        assert journal.read() == [['ls', 'host', 'host1', {'ls_next_check': 20}]]
+        journal.commit()
+        journal.close()
+        assert journal.size == 0
+
+        journal = Journal(self.path, 'broker')
+        assert journal.read() == []
+
+    def test_02_fsync_interval(self):
+        """The journal is fsynced at most once per interval
+
+        :return: None
+        """
+        journal = Journal(self.path, 'broker', fsync_interval=0)
+        assert journal.sync() is False
+        journal.append(['lcr', {}])
+        assert journal.sync() is True
+        assert journal.sync() is False
+        assert journal.fsyncs == 1
+
+        journal.fsync_interval = 60
+        for _ in range(10):
+            journal.append(['lcr', {}])
+            assert journal.sync() is False
+        assert journal.sync(force=True) is True
+        assert journal.fsyncs == 2
+        assert journal.get_stats()['records'] == 11
+
+    def test_03_corrupted(self):
+        """A partially written record is ignored
+
+        :return: None
+        """
+        journal = Journal(self.path, 'broker')
+        journal.append(['lcr', {'host_name': 'host0'}])
+        journal.close()
+        with open(os.path.join(self.path, 'broker.journal'), 'ab') as journal_file:
+            journal_file.write(b'["lcr", {"host_na')
+
+        journal = Journal(self.path, 'broker')
+        assert journal.read() == [['lcr', {'host_name': 'host0'}]]
+
+
+class TestBrokerJournalReplay(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_01_replay_backend_not_available(self):
+        """The replayed LCRs are kept while the backend is not available and no spool exists
+
+        :return: None
+        """
+        journal = Journal(self.path, 'broker')
+        journal.append(['lcr', {'host_name': 'host0', 'state': 'UP'}])
+        journal.append(['lcr', {'host_name': 'host1', 'state': 'DOWN'}])
+        journal.close()
+
+        # The backend is not available when the module starts
+        module = get_module(available=False, load_refs=False, journal_dir=self.path)
+        assert not module.backend_connected
+        module.replay_journal()
+        assert len(module.logcheckresults) == 2
+        assert FakeBackend.sent('POST', 'logcheckresult') == []
+
+        # Still journaled, even after a module crash
+        module.journal.sync(force=True)
+        assert Journal(self.path, 'broker').read() == [
+            ['lcr', {'host_name': 'host0', 'state': 'UP'}],
+            ['lcr', {'host_name': 'host1', 'state': 'DOWN'}]
+        ]
+
+        # The backend is available again, the LCRs are posted on the next loop turn
+        FakeBackend.available = True
+        module.breaker.retry_at = 0
+        run_queue(module, [[]])
+        posted = [lcr for request in FakeBackend.sent('POST', 'logcheckresult')
+                  for lcr in request[2]]
+        assert [lcr['host_name'] for lcr in posted] == ['host0', 'host1']
+        assert module.logcheckresults == []
+        module.journal.close()
+        assert Journal(self.path, 'broker').read() == []
+
+    def test_02_post_failed(self):
+        """The journaled LCRs whose post failed are kept pending when no spool exists
+
+        :return: None
+        """
+        module = get_module(journal_dir=self.path)
+        FakeBackend.available = False
+        module.logcheckresults = [{'host_name': 'host0', 'state': 'UP'}]
+        assert module.send_to_backend('lcrs', None, None) is False
+        assert module.logcheckresults == [{'host_name': 'host0', 'state': 'UP'}]
+        module.journal.commit(module.get_journal_pending())
+        module.journal.close()
+        assert Journal(self.path, 'broker').read() == [
+            ['lcr', {'host_name': 'host0', 'state': 'UP'}]
+        ]
+
+    def test_03_pending_limit(self):
+        """The pending LCRs are limited and the journal is truncated once they are posted
+
+        :return: None
+        """
+        module = get_module(journal_dir=self.path, journal_max_lcrs='3', batch_max_messages='1')
+        FakeBackend.available = False
+
+        def check_results(count):
+            """Get some queue messages of an host check result"""
+            return [[Brok(dict(zip(['type', 'data'],
+                                   get_check_result('host0', '', int(time.time())))))]
+                    for _ in range(count)]
+
+        run_queue(module, check_results(5))
+        assert len(module.logcheckresults) == 3
+        assert module.statsmgr.stats['journal-dropped.lcr'] == 2
+        # Only appended while the LCRs are pending
+        assert len(module.journal) == 5
+        assert 'journal-compacted' not in module.statsmgr.stats
+
+        # Rewritten with the pending LCRs when it is too large
+        run_queue(module, check_results(2))
+        assert len(module.journal) == 3
+        assert module.statsmgr.stats['journal-compacted'] == 1
+        module.journal.sync(force=True)
+        assert len(Journal(self.path, 'broker').read()) == 3
+
+        # The backend is available again
+        FakeBackend.available = True
+        FakeBackend.reset()
+        module.breaker.retry_at = 0
+        run_queue(module, [[]])
+        assert len(FakeBackend.sent('POST', 'logcheckresult')[0][2]) == 3
+        assert len(module.journal) == 0
+        module.journal.close()
+        assert Journal(self.path, 'broker').read() == []
+
+    def test_04_livestates_pending(self):
+        """The journaled live states that were not sent are kept pending
+
+        :return: None
+        """
+        module = get_module(journal_dir=self.path, batch_max_messages='1')
+        FakeBackend.available = False
+
+        def next_schedule(next_check):
+            """Get a queue message of an host next schedule"""
+            return [Brok({'type': 'host_next_schedule',
+                          'data': {'host_name': 'host0', 'next_chk': next_check}})]
+
+        run_queue(module, [next_schedule(100), next_schedule(200)])
+        assert len(FakeBackend.sent('PATCH', 'host/h0')) == 1
+        assert module.livestates['host'] == {'host0': {'ls_next_check': 200}}
+
+        # Still journaled, even after a module crash
+        module.journal.sync(force=True)
+        assert Journal(self.path, 'broker').read() == [
+            ['ls', 'host', 'host0', {'ls_next_check': 100}],
+            ['ls', 'host', 'host0', {'ls_next_check': 200}]
+        ]
+
+        # The backend is available again
+        FakeBackend.available = True
+        FakeBackend.reset()
+        module.breaker.retry_at = 0
+        run_queue(module, [[]])
+        assert FakeBackend.sent('PATCH', 'host/h0')[0][2] == {'ls_next_check': 200}
+        assert FakeBackend.items['host']['h0']['ls_next_check'] == 200
+        assert module.livestates['host'] == {}
+        module.journal.close()
+        assert Journal(self.path, 'broker').read() == []
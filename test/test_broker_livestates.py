@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest2
+
+from alignak.brok import Brok
+from alignak_backend_client.client import BackendException
+
+from fakes import FakeBackend, get_module, run_queue
+
+
+def next_schedule(host, next_check, service=None):
+    """Get a next schedule brok"""
+    data = {'host_name': host, 'next_chk': next_check}
+    if service:
+        data['service_description'] = service
+        return Brok({'type': 'service_next_schedule', 'data': data})
+    return Brok({'type': 'host_next_schedule', 'data': data})
+
+
+class TestBrokerLivestates(unittest2.TestCase):
+
+    def test_01_unknown_objects(self):
+        """The live states of the objects deleted by a configuration reload are not sent
+
+        :return: None
+        """
+        module = get_module(incremental_refs='1', batch_max_messages='10')
+        del FakeBackend.items['host']['h1']
+
+        # The host is deleted by the reload in the same batch as its live state update
+        run_queue(module, [[next_schedule('host0', 100), next_schedule('host1', 100)],
+                           [Brok({'type': 'new_conf', 'data': {}})]])
+        assert 'host1' not in module.mapping['host']
+        assert [request[1] for request in FakeBackend.sent('PATCH')] == ['host/h0']
+        assert module.patch_livestate('host', 'host1', {'ls_next_check': 200}) is False
+
+    def test_02_flush_exception(self):
+        """An exception when the data are sent does not stop the module loop
+
+        :return: None
+        """
+        module = get_module(batch_max_messages='1')
+        send_livestates = module.send_livestates
+        failures = []
+
+        def failing_send_livestates(livestates, backend):
+            """Fail on the first call"""
+            if not failures:
+                failures.append(livestates)
+                raise RuntimeError('Unexpected failure')
+            return send_livestates(livestates, backend)
+        module.send_livestates = failing_send_livestates
+
+        run_queue(module, [[next_schedule('host0', 100)], [next_schedule('host1', 100)]])
+        assert len(failures) == 1
+        assert [request[1] for request in FakeBackend.sent('PATCH')] == ['host/h1']
+
+    def test_03_etag_conflict(self):
+        """A live state update is retried once with the item _etag got from the backend
+
+        :return: None
+        """
+        module = get_module()
+        # Modified by another client
+        FakeBackend.items['host']['h0']['_etag'] = 'modified'
+        assert module.patch_livestate('host', 'host0', {'ls_next_check': 100}) is True
+
+        patches = FakeBackend.sent('PATCH', 'host/h0')
+        assert [request[3]['If-Match'] for request in patches] == ['e', 'modified']
+        gets = FakeBackend.sent('GET', 'host/h0')
+        assert len(gets) == 1
+        assert json.loads(gets[0][2]['projection']) == {'_etag': 1}
+        assert module.statsmgr.stats['backend-conflict.host'] == 1
+        assert module.ref_live['host']['h0']['_etag'] == FakeBackend.items['host']['h0']['_etag']
+        assert FakeBackend.items['host']['h0']['ls_next_check'] == 100
+
+        # Only one retry
+        requests = []
+
+        def conflicting_patch(endpoint, data, headers=None, inception=False):
+            """Always refuse the update"""
+            requests.append(headers['If-Match'])
+            raise BackendException(412, 'Precondition failed')
+        module.backend.patch = conflicting_patch
+        assert module.patch_livestate('host', 'host0', {'ls_next_check': 200}) is False
+        assert len(requests) == 2
+        assert module.statsmgr.stats['backend-conflict.host'] == 2
+        assert module.backend_connected
+
+    def test_04_suppressed(self):
+        """The live state values already sent are not sent again
+
+        :return: None
+        """
+        module = get_module(batch_max_messages='1')
+        run_queue(module, [[next_schedule('host0', 100)], [next_schedule('host0', 100)]])
+        assert len(FakeBackend.sent('PATCH', 'host/h0')) == 1
+        assert module.statsmgr.stats['livestate-suppressed.host'] == 1
+
+        # A changed value is sent
+        run_queue(module, [[next_schedule('host0', 200)]])
+        assert len(FakeBackend.sent('PATCH', 'host/h0')) == 2
+
+        # The host was modified by another client, its sent values are forgotten
+        module.livestates_sent['host']['h0']['ls_acknowledged'] = True
+        FakeBackend.items['host']['h0']['_etag'] = 'modified'
+        run_queue(module, [[next_schedule('host0', 300)]])
+        assert len(FakeBackend.sent('PATCH', 'host/h0')) == 4
+        assert module.livestates_sent['host']['h0'] == {'ls_next_check': 300}
+
+        # The sent values are forgotten when the objects are reloaded
+        run_queue(module, [[next_schedule('host0', 300)]])
+        assert module.statsmgr.stats['livestate-suppressed.host'] == 2
+        module.last_load = 0
+        module.get_refs()
+        assert module.livestates_sent == {'host': {}, 'service': {}}
+        run_queue(module, [[next_schedule('host0', 300)]])
+        assert len(FakeBackend.sent('PATCH', 'host/h0')) == 5
+        assert module.statsmgr.stats['livestate-suppressed.host'] == 2
+
+    def test_05_not_cached(self):
+        """All the live state updates are sent when the live states cache is disabled
+
+        :return: None
+        """
+        module = get_module(batch_max_messages='1', livestate_cache='0')
+        run_queue(module, [[next_schedule('host0', 100)], [next_schedule('host0', 100)]])
+        assert len(FakeBackend.sent('PATCH', 'host/h0')) == 2
+        assert 'livestate-suppressed.host' not in module.statsmgr.stats
+
+    def test_06_sender_workers(self):
+        """The live states are dispatched to the sender workers, per object
+
+        :return: None
+        """
+        module = get_module(hosts=8, services=2, batch_max_messages='1', sender_workers='4')
+        messages = []
+        for next_check in [100, 200, 300]:
+            messages.append([next_schedule('host%d' % host, next_check, service)
+                             for host in range(8) for service in [None, 'service0']])
+        run_queue(module, messages)
+        assert len(FakeBackend.sent('PATCH')) == 48
+        assert 'backend-conflict.host' not in module.statsmgr.stats
+        assert 'backend-conflict.service' not in module.statsmgr.stats
+        for obj_type in ['host', 'service']:
+            for item in FakeBackend.items[obj_type].values():
+                if item['ls_next_check']:
+                    assert item['ls_next_check'] == 300
+                    assert module.ref_live[obj_type][item['_id']]['_etag'] == item['_etag']
+
+        # The fake backend _etag contains the client that patched the item: the workers
+        # clients were used, and an object is always patched by the same worker
+        clients = set(id(backend) for backend in module.sender_backends)
+        assert len(module.sender_backends) == 4
+        patched_by = {}
+        for request in FakeBackend.sent('PATCH'):
+            patched_by.setdefault(request[1], []).append(request[3]['If-Match'].split('-')[0])
+        for etags in patched_by.values():
+            # The next PATCH of an object uses the _etag of its previous PATCH
+            assert int(etags[1]) in clients
+            assert etags[2] == etags[1]
+        workers = set(etags[1] for etags in patched_by.values())
+        assert len(workers) > 1
+
+    def test_07_periodic_task_exception(self):
+        """An exception in a periodic task does not stop the module loop nor the other tasks
+
+        :return: None
+        """
+        module = get_module(batch_max_messages='1', next_check_bulk_endpoint='nextcheck')
+        failures = []
+
+        def failing_check_journal():
+            """Fail as a journal I/O error"""
+            failures.append(True)
+            raise OSError(28, 'No space left on device')
+        module.check_journal = failing_check_journal
+
+        run_queue(module, [[next_schedule('host0', 100)], [next_schedule('host1', 100)]])
+        assert len(failures) >= 2
+        # The next checks are posted by the previous task, the metrics are still exported
+        assert len(FakeBackend.sent('POST', 'nextcheck')) == 2
+        module.metrics_interval = 1
+        module.metrics_exported = 0
+        run_queue(module, [[]])
+        assert module.metrics_exported > 0
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest2
+
+from alignak_backend_client.client import BackendException
+
+from alignak_module_backend.broker.metrics import Histogram, Metrics
+
+from fakes import FakeStats, get_module
+
+
+class TestBrokerMetrics(unittest2.TestCase):
+
+    def test_01_histogram(self):
+        """The histogram percentiles are close to the measures percentiles
+
+        :return: None
+        """
+        histogram = Histogram()
+        assert histogram.percentile(99) == 0.0
+
+        # 1 ms to 1 s measures
+        for value in range(1, 1001):
+            histogram.observe(value / 1000.0)
+        stats = histogram.get_stats()
+        assert stats['count'] == 1000
+        assert stats['max'] == 1.0
+        self.assertAlmostEqual(stats['mean'], 0.5005)
+        for key, expected in [('p50', 0.5), ('p95', 0.95), ('p99', 0.99)]:
+            assert expected <= stats[key] <= expected * 1.25
+
+        # The percentile is never greater than the max measure
+        histogram = Histogram()
+        histogram.observe(0.0011)
+        assert histogram.percentile(50) == 0.0011
+
+    def test_02_metrics(self):
+        """The histograms are exported and reset
+
+        :return: None
+        """
+        metrics = Metrics()
+        for _ in range(10):
+            metrics.observe('http.patch.host', 0.01)
+        metrics.observe('brok.host_check_result', 0.001)
+        stats = metrics.get_stats()
+        self.assertEqual(sorted(stats), ['brok.host_check_result', 'http.patch.host'])
+        assert stats['http.patch.host']['count'] == 10
+
+        statsmgr = FakeStats()
+        metrics.export(statsmgr)
+        assert statsmgr.stats['latency.http.patch.host.count'] == 10
+        assert statsmgr.stats['latency.http.patch.host.p99'] == 0.01
+        assert 'latency.brok.host_check_result.p50' in statsmgr.stats
+        assert metrics.get_stats() == {}
+
+
+class TestBrokerPostStatistics(unittest2.TestCase):
+
+    def test_01_failed_batches(self):
+        """The throughput statistics only count the posted LCRs
+
+        :return: None
+        """
+        module = get_module(lcr_batch_count='2', latency=0.01)
+        post = module.compression.post
+
+        def failing_post(backend, endpoint, data):
+            """Fail to post the host1 LCRs"""
+            if data[0]['host_name'] == 'host1':
+                raise BackendException(500, 'Internal server error')
+            return post(backend, endpoint, data)
+        module.compression.post = failing_post
+
+        lcrs = [{'host_name': 'host%d' % (index // 2), 'output': 'x' * 100}
+                for index in range(6)]
+        module.logcheckresults = list(lcrs)
+        assert module.send_to_backend('lcrs', None, None) is False
+        assert module.statsmgr.stats['backend-post.lcr'] == 4
+        assert module.statsmgr.stats['backend-post-failed.lcr'] == 2
+        assert module.statsmgr.stats['backend-post-batches.lcr'] == 3
+        duration = module.statsmgr.stats['backend-post-time.lcrs']
+        assert module.statsmgr.stats['backend-post-rate.lcr'] == int(4 / duration)
+        size = sum(len(json.dumps(lcr)) for lcr in lcrs if lcr['host_name'] != 'host1')
+        assert module.statsmgr.stats['backend-post-bytes-rate.lcr'] == int(size / duration)
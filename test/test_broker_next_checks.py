@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest2
+
+from alignak.brok import Brok
+
+from fakes import FakeBackend, get_module, run_queue
+
+
+def next_schedules(next_check, hosts=2, services=2):
+    """Get the next schedule broks of all the hosts and services"""
+    broks = []
+    for host in range(hosts):
+        broks.append(Brok({'type': 'host_next_schedule',
+                           'data': {'host_name': 'host%d' % host, 'next_chk': next_check}}))
+        for service in range(services):
+            broks.append(Brok({'type': 'service_next_schedule',
+                               'data': {'host_name': 'host%d' % host,
+                                        'service_description': 'service%d' % service,
+                                        'next_chk': next_check}}))
+    return broks
+
+
+class TestBrokerNextChecks(unittest2.TestCase):
+
+    def test_01_batches(self):
+        """The next checks are posted by batches to the bulk endpoint
+
+        :return: None
+        """
+        module = get_module(next_check_bulk_endpoint='nextcheck', next_check_bulk_size='4')
+        # Only the last next check of an object is posted
+        run_queue(module, [next_schedules(100) + next_schedules(200)])
+        assert FakeBackend.sent('PATCH') == []
+        posts = FakeBackend.sent('POST', 'nextcheck')
+        assert [len(request[2]) for request in posts] == [4, 2]
+        items = posts[0][2] + posts[1][2]
+        assert sorted((item['item_type'], item['item_id']) for item in items) == \
+            sorted([('host', 'h0'), ('host', 'h1'), ('service', 's0_0'), ('service', 's0_1'),
+                    ('service', 's1_0'), ('service', 's1_1')])
+        assert set(item['ls_next_check'] for item in items) == set([200])
+        assert module.statsmgr.stats['backend-post.next-check'] == 2
+        assert module.statsmgr.stats['next-checks-count'] == 6
+        assert module.next_checks == {'host': {}, 'service': {}}
+
+        # Not sent again
+        run_queue(module, [next_schedules(200)])
+        assert len(FakeBackend.sent('POST', 'nextcheck')) == 2
+        assert module.statsmgr.stats['next-checks-count'] == 0
+
+    def test_02_etag(self):
+        """The objects references _etag are updated from the bulk endpoint response
+
+        :return: None
+        """
+        module = get_module(next_check_bulk_endpoint='nextcheck')
+        run_queue(module, [next_schedules(100)])
+        for obj_type in ['host', 'service']:
+            for item_id, item in FakeBackend.items[obj_type].items():
+                assert item['_etag'] != 'e'
+                assert module.ref_live[obj_type][item_id]['_etag'] == item['_etag']
+
+        # The next update uses the new _etag
+        brok = Brok({'type': 'update_host_status',
+                     'data': {'host_name': 'host0', 'active_checks_enabled': False}})
+        assert module.manage_brok(brok) is True
+        assert 'backend-conflict.host' not in module.statsmgr.stats
+        assert FakeBackend.items['host']['h0']['active_checks_enabled'] is False
+
+    def test_03_not_available(self):
+        """The next checks are not posted when the backend is not available
+
+        :return: None
+        """
+        module = get_module(next_check_bulk_endpoint='nextcheck', next_check_bulk_size='2')
+        module.manage_brok(next_schedules(100)[0])
+        FakeBackend.available = False
+        assert module.post_next_checks() is False
+        assert not module.backend_connected
+        assert module.next_checks == {'host': {}, 'service': {}}
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest2
+
+from alignak.brok import Brok
+
+from fakes import FakeBackend, get_module
+
+
+def program_status(**data):
+    """Get an update program status brok"""
+    data['alignak_name'] = 'arbiter-master'
+    return Brok({'type': 'update_program_status', 'data': data})
+
+
+def get_program_module(**options):
+    """Get a broker module that manages the program status, with an alignak item"""
+    module = get_module(update_program_status='1', **options)
+    FakeBackend.items['alignak']['a1'] = {
+        '_id': 'a1', '_etag': 'e', '_realm': 'r1', 'name': 'arbiter-master',
+        'last_alive': 1, 'is_running': True
+    }
+    return module
+
+
+class TestBrokerProgramStatus(unittest2.TestCase):
+
+    def test_01_cached_item(self):
+        """The alignak item is got once and only its modified properties are updated
+
+        :return: None
+        """
+        module = get_program_module()
+        module.manage_brok(program_status(last_alive=2, is_running=True))
+        assert len(FakeBackend.sent('GET', 'alignak')) == 1
+        assert FakeBackend.sent('PATCH', 'alignak/a1')[0][2] == {'last_alive': 2}
+
+        # Nothing changed
+        module.manage_brok(program_status(last_alive=2, is_running=True))
+        assert len(FakeBackend.sent('PATCH')) == 1
+
+        module.manage_brok(program_status(last_alive=3, is_running=True))
+        patches = FakeBackend.sent('PATCH', 'alignak/a1')
+        assert [request[2] for request in patches] == [{'last_alive': 2}, {'last_alive': 3}]
+        # The _etag of the previous update is used
+        assert patches[1][3]['If-Match'] != 'e'
+        assert 'backend-conflict.alignak' not in module.statsmgr.stats
+        assert len(FakeBackend.sent('GET', 'alignak')) == 1
+        assert module.alignak_items['arbiter-master']['last_alive'] == 3
+        assert module.alignak_items['arbiter-master']['_etag'] == \
+            FakeBackend.items['alignak']['a1']['_etag']
+
+        # Modified by another client, the cached _etag is updated
+        FakeBackend.items['alignak']['a1']['_etag'] = 'modified'
+        module.manage_brok(program_status(last_alive=4, is_running=True))
+        assert FakeBackend.items['alignak']['a1']['last_alive'] == 4
+        assert module.alignak_items['arbiter-master']['_etag'] == \
+            FakeBackend.items['alignak']['a1']['_etag']
+        assert len(FakeBackend.sent('GET', 'alignak')) == 1
+
+    def test_02_heartbeat(self):
+        """Only the running properties changes are delayed by the heartbeat
+
+        :return: None
+        """
+        module = get_program_module(program_status_heartbeat='60')
+        for last_alive in [2, 3]:
+            module.manage_brok(program_status(last_alive=last_alive, is_running=True))
+        assert FakeBackend.sent('PATCH') == []
+        assert module.statsmgr.stats['program-status-delayed'] == 2
+
+        # A configuration property changed
+        module.manage_brok(program_status(last_alive=4, is_running=False))
+        assert FakeBackend.sent('PATCH', 'alignak/a1')[0][2] == \
+            {'last_alive': 4, 'is_running': False}
+
+        # The heartbeat delay elapsed
+        module.manage_brok(program_status(last_alive=5, is_running=False))
+        assert len(FakeBackend.sent('PATCH')) == 1
+        module.alignak_updated['arbiter-master'] -= 60
+        module.manage_brok(program_status(last_alive=6, is_running=False))
+        assert FakeBackend.sent('PATCH', 'alignak/a1')[1][2] == {'last_alive': 6}
+
+    def test_03_not_found(self):
+        """An alignak item not found in the backend is created and not cached
+
+        :return: None
+        """
+        module = get_module(update_program_status='1')
+        module.manage_brok(program_status(last_alive=2, is_running=True))
+        assert FakeBackend.sent('POST', 'alignak')[0][2]['name'] == 'arbiter-master'
+        assert module.alignak_items == {}
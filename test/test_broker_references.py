@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest2
+
+from alignak_module_backend.broker.references import LiveRef, get_references_size
+
+from fakes import BACKEND_DATE, FakeBackend, get_module
+
+
+class TestBrokerReferences(unittest2.TestCase):
+
+    def test_01_live_ref(self):
+        """A reference behaves as a dictionary
+
+        :return: None
+        """
+        ref = LiveRef('5a1b2c3d', 'etag-1', 'realm-all', 'UP', 'HARD')
+        assert ref['_id'] == '5a1b2c3d'
+        assert ref['initial_state'] == 'UP'
+        self.assertEqual(ref, {'_id': '5a1b2c3d', '_etag': 'etag-1', '_realm': 'realm-all',
+                               'initial_state': 'UP', 'initial_state_type': 'HARD'})
+
+        ref['_etag'] = 'etag-2'
+        assert ref['_etag'] == 'etag-2'
+
+        del ref['initial_state']
+        assert 'initial_state' not in ref
+        with self.assertRaises(KeyError):
+            ref['initial_state']
+        with self.assertRaises(KeyError):
+            ref['unknown'] = 1
+
+        # A user reference has no state
+        ref = LiveRef('5a1b2c3e', 'etag-1', 'realm-all')
+        self.assertEqual(ref, {'_id': '5a1b2c3e', '_etag': 'etag-1', '_realm': 'realm-all'})
+        assert not hasattr(ref, '__dict__')
+
+    def test_02_references_size(self):
+        """The references are smaller than the dictionaries
+
+        :return: None
+        """
+        ref_live = {'host': {}}
+        dict_ref_live = {'host': {}}
+        for index in range(1000):
+            item_id = '5a1b2c3d%016d' % index
+            ref_live['host'][item_id] = LiveRef(item_id, 'etag-%d' % index,
+                                                ''.join(['realm', '-all']), 'UP', 'HARD')
+            dict_ref_live['host'][item_id] = {
+                '_id': item_id, '_etag': 'etag-%d' % index, '_realm': ''.join(['realm', '-all']),
+                'initial_state': 'UP', 'initial_state_type': 'HARD'
+            }
+        assert get_references_size(ref_live) < get_references_size(dict_ref_live)
+        self.assertEqual(ref_live, dict_ref_live)
+
+
+if __name__ == '__main__':
+    unittest2.main()
+
+
+class TestBrokerReferencesLoading(unittest2.TestCase):
+
+    @staticmethod
+    def get_ids_requests():
+        """Get the requests of the backend items identifiers lists"""
+        return [request[1] for request in FakeBackend.sent('GET')
+                if request[2].get('projection') == '{"_id":1}' and
+                request[2].get('max_results') != 1]
+
+    def test_01_incremental(self):
+        """Only the updated items are got, the deleted items are removed
+
+        :return: None
+        """
+        module = get_module(incremental_refs='1')
+        # A service of an unknown host is not referenced
+        FakeBackend.items['service']['orphan'] = {
+            '_id': 'orphan', '_etag': 'e', '_realm': 'r1', 'host': 'unknown',
+            'name': 'orphan', 'ls_state': 'OK', 'ls_state_type': 'HARD',
+            '_updated': BACKEND_DATE, '_is_template': False
+        }
+        module.refs_loaded_time = None
+        module.last_load = 0
+        module.get_refs()
+        assert len(module.ref_live['service']) == 4
+        assert module.refs_ignored['service'] == set(['orphan'])
+
+        # Nothing was deleted, the backend items identifiers are not got
+        FakeBackend.reset()
+        module.get_refs()
+        assert self.get_ids_requests() == []
+        assert len(FakeBackend.sent('GET')) == 6
+
+        # A deleted host is removed
+        del FakeBackend.items['host']['h1']
+        FakeBackend.reset()
+        module.get_refs()
+        assert self.get_ids_requests() == ['host']
+        assert sorted(module.mapping['host']) == ['host0']
+        assert sorted(module.ref_live['host']) == ['h0']
+
+    def test_02_shard(self):
+        """A shard process always gets the backend items identifiers
+
+        :return: None
+        """
+        module = get_module(incremental_refs='1', shards='2')
+        module.shard = 0
+        FakeBackend.reset()
+        assert module.remove_deleted_refs('host', module.mapping['host'],
+                                          module.ref_live['host']) == 0
+        assert self.get_ids_requests() == ['host']
+        assert len(FakeBackend.sent('GET')) == 1
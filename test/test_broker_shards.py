@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import signal
+import queue
+import threading
+import multiprocessing
+import unittest2
+
+from alignak.brok import Brok
+
+import alignak_module_backend.broker.module as broker_module
+
+from fakes import FakeBackend, get_module
+
+
+def get_shard_module(shard, **options):
+    """Get the broker module of a shard process, with its references loaded"""
+    module = get_module(hosts=8, services=2, shards='3', load_refs=False, **options)
+    module.shard = shard
+    module.get_refs()
+    FakeBackend.reset()
+    return module
+
+
+class ShardBackend(FakeBackend):
+    """Fake backend that records the updates in a list shared with the shards processes"""
+    updates = None
+
+    def patch(self, endpoint, data, headers=None, inception=False):
+        """Record the process that updates an item"""
+        self.updates.append((os.getpid(), endpoint, data.get('ls_next_check')))
+        return super(ShardBackend, self).patch(endpoint, data, headers, inception)
+
+    def get_all(self, endpoint, params=None):
+        """Record the process that loads the references"""
+        if endpoint == 'host':
+            self.updates.append((os.getpid(), endpoint, None))
+        return super(ShardBackend, self).get_all(endpoint, params)
+
+
+class TestBrokerShards(unittest2.TestCase):
+
+    def test_01_brok_shard(self):
+        """The broks of an host and of its services are managed by the same shard
+
+        :return: None
+        """
+        module = get_module(shards='3')
+        shards = set()
+        for host in range(8):
+            host_name = 'host%d' % host
+            shard = module.get_host_shard(host_name)
+            shards.add(shard)
+            broks = [
+                Brok({'type': 'host_next_schedule',
+                      'data': {'host_name': host_name, 'next_chk': 100}}),
+                Brok({'type': 'service_check_result',
+                      'data': {'host_name': host_name, 'service_description': 'service0'}}),
+                Brok({'type': 'acknowledge_raise',
+                      'data': {'host': host_name, 'service': 'service0'}})
+            ]
+            for brok in broks:
+                brok.prepare()
+                assert module.get_brok_shard(brok) == shard
+        assert shards == set([0, 1, 2])
+
+        # The other broks are managed by the first shard
+        brok = Brok({'type': 'update_contact_status', 'data': {'contact_name': 'admin'}})
+        brok.prepare()
+        assert module.get_brok_shard(brok) == 0
+
+        # Not a shard process
+        assert all(module.in_shard('host%d' % host) for host in range(8))
+
+    def test_02_references(self):
+        """A shard process only loads the references of its hosts and of their services
+
+        :return: None
+        """
+        hosts = set()
+        for shard in range(3):
+            module = get_shard_module(shard)
+            shard_hosts = set(module.mapping['host'])
+            assert shard_hosts
+            assert all(module.get_host_shard(host_name) == shard for host_name in shard_hosts)
+            assert not hosts & shard_hosts
+            hosts |= shard_hosts
+
+            assert sorted(module.mapping['service']) == \
+                sorted('%s__service%d' % (host_name, service)
+                       for host_name in shard_hosts for service in range(2))
+            assert sorted(module.ref_live['host']) == \
+                sorted(module.mapping['host'][host_name] for host_name in shard_hosts)
+            assert len(module.ref_live['service']) == 2 * len(shard_hosts)
+            # All the users are loaded by all the shards
+            assert list(module.mapping['user']) == ['admin']
+        assert hosts == set('host%d' % host for host in range(8))
+
+    def test_03_other_shard(self):
+        """A shard process does not update the hosts of the other shards
+
+        :return: None
+        """
+        module = get_shard_module(0)
+        other_host = [host_name for host_name in ['host%d' % host for host in range(8)]
+                      if not module.in_shard(host_name)][0]
+        assert module.patch_livestate('host', other_host, {'ls_next_check': 100}) is False
+        assert FakeBackend.sent('PATCH') == []
+
+    def test_04_incremental(self):
+        """The updated services of the hosts of the other shards are not referenced
+
+        :return: None
+        """
+        module = get_shard_module(0, incremental_refs='1')
+        services = sorted(module.mapping['service'])
+        other_hosts = dict((item['_id'], item['name'])
+                           for item in FakeBackend.items['host'].values()
+                           if not module.in_shard(item['name']))
+        assert module.other_shards_hosts == other_hosts
+
+        # Only the services are updated
+        for item in FakeBackend.items['service'].values():
+            item['_updated'] = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        module.get_refs()
+        assert module.refs_ignored['service'] == set()
+        assert sorted(module.mapping['service']) == services
+
+        # A deleted host of another shard is forgotten
+        host_id = sorted(other_hosts)[0]
+        del FakeBackend.items['host'][host_id]
+        module.get_refs()
+        assert host_id not in module.other_shards_hosts
+
+    def test_05_route_broks(self):
+        """The broks are routed to the shards processes, the new_conf brok to all of them
+
+        :return: None
+        """
+        module = get_module(hosts=4, services=0, shards='2', batch_max_messages='1')
+        module.last_load = 0
+        manager = multiprocessing.Manager()
+        ShardBackend.updates = manager.list()
+        broker_module.Backend = ShardBackend
+
+        module.to_q = queue.Queue()
+        module.to_q.put([Brok({'type': 'new_conf', 'data': {}})])
+        for next_check in [100, 200, 300]:
+            module.to_q.put([Brok({'type': 'host_next_schedule',
+                                   'data': {'host_name': 'host%d' % host,
+                                            'next_chk': next_check}})
+                             for host in range(4)])
+        pids = []
+
+        def stop():
+            """Stop the module when the shards sent all the updates"""
+            timeout = time.time() + 30
+            while len(ShardBackend.updates) < 14 and time.time() < timeout:
+                time.sleep(0.05)
+            pids.extend(process.pid for process in module.shard_processes)
+            module.interrupted = True
+
+        module.interrupted = False
+        module.queue_timeout = 0.1
+        stopper = threading.Thread(target=stop)
+        stopper.start()
+        try:
+            module.route_broks()
+        finally:
+            stopper.join()
+            broker_module.Backend = FakeBackend
+        updates = list(ShardBackend.updates)
+        manager.shutdown()
+
+        assert module.shard_processes == []
+        assert len(pids) == 2 and os.getpid() not in pids
+        # Both shards reloaded their references
+        assert sorted(pid for pid, endpoint, _ in updates if endpoint == 'host') == sorted(pids)
+
+        patches = [update for update in updates if update[1] != 'host']
+        assert len(patches) == 12
+        for host in range(4):
+            host_patches = [update for update in patches if update[1] == 'host/h%d' % host]
+            # Managed by the host shard, in the received order
+            shard = module.get_host_shard('host%d' % host)
+            assert set(pid for pid, _, _ in host_patches) == set([pids[shard]])
+            assert [next_check for _, _, next_check in host_patches] == [100, 200, 300]
+
+    def test_06_metrics_dump(self):
+        """The module process forwards the metrics dump request to the shards processes
+
+        :return: None
+        """
+        module = get_module(shards='2')
+        assert module.spool is None
+
+        class Process(object):
+            """Shard process"""
+            def __init__(self, pid):
+                self.pid = pid
+
+            @staticmethod
+            def is_alive():
+                return True
+
+        killed = []
+        kill = os.kill
+        os.kill = lambda pid, sig: killed.append((pid, sig))
+        try:
+            module.shard_processes = [Process(1001), Process(1002)]
+            module.manage_signal(signal.SIGUSR1, None)
+        finally:
+            os.kill = kill
+        assert killed == [(1001, signal.SIGUSR1), (1002, signal.SIGUSR1)]
+        assert module.metrics_dump_requested is False
+
+        # In a shard process
+        module.shard_processes = []
+        module.manage_signal(signal.SIGUSR1, None)
+        assert module.metrics_dump_requested is True
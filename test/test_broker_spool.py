@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+import unittest2
+
+from alignak_module_backend.broker.spool import Spool
+
+from fakes import FakeBackend, get_module
+
+
+class TestBrokerSpool(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_01_append_read_ack(self):
+        """Items are read in the order they were appended, and removed once acknowledged
+
+        :return: None
+        """
+        spool = Spool(self.path, 'lcr')
+        assert len(spool) == 0
+        assert spool.read(10) == ([], None)
+
+        assert spool.append([{'host_name': 'srv001', 'state': 'UP'},
+                             {'host_name': 'srv002', 'state': 'DOWN'}]) == 2
+        assert spool.append([{'host_name': 'srv003', 'state': 'UP'}]) == 1
+        assert len(spool) == 3
+
+        items, position = spool.read(2)
+        assert [item['host_name'] for item in items] == ['srv001', 'srv002']
+        # Not acknowledged, the same items are read again
+        items, position = spool.read(2)
+        assert [item['host_name'] for item in items] == ['srv001', 'srv002']
+        spool.ack(position)
+        assert len(spool) == 1
+
+        items, position = spool.read(2)
+        assert [item['host_name'] for item in items] == ['srv003']
+        spool.ack(position)
+        assert len(spool) == 0
+        assert spool.get_stats() == {'depth': 0, 'size': 0, 'segments': 0, 'dropped': 0}
+
+    def test_02_restart(self):
+        """The pending items and the read position survive a spool restart
+
+        :return: None
+        """
+        spool = Spool(self.path, 'lcr')
+        spool.append([{'index': index} for index in range(10)])
+        items, position = spool.read(4)
+        spool.ack(position)
+
+        spool = Spool(self.path, 'lcr')
+        assert len(spool) == 6
+        items, position = spool.read(100)
+        assert [item['index'] for item in items] == list(range(4, 10))
+
+    def test_03_rotation_and_limits(self):
+        """Segments are rotated and the oldest ones are dropped when the spool is full
+
+        :return: None
+        """
+        spool = Spool(self.path, 'lcr', segment_size=100, max_size=1000)
+        for index in range(100):
+            spool.append([{'index': index, 'output': 'x' * 20}])
+
+        stats = spool.get_stats()
+        assert stats['segments'] > 1
+        assert stats['size'] <= 1000 + 100
+        assert stats['dropped'] > 0
+        assert stats['depth'] + stats['dropped'] == 100
+
+        # The most recent items are kept
+        items = []
+        while len(spool):
+            read, position = spool.read(100)
+            items.extend(read)
+            spool.ack(position)
+        assert items[-1]['index'] == 99
+        assert len(items) == stats['depth']
+
+
+if __name__ == '__main__':
+    unittest2.main()
+
+
+class TestBrokerSpoolDrain(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_01_drain_rate(self):
+        """The spooled LCRs are drained by a limited count of items per interval
+
+        :return: None
+        """
+        module = get_module(spool_dir=self.path, spool_drain_count='3',
+                            spool_drain_interval='60')
+        module.spool.append([{'host_name': 'host0', 'output': str(index)}
+                             for index in range(10)])
+        assert module.drain_spool() == 3
+        assert [lcr['output'] for request in FakeBackend.sent('POST', 'logcheckresult')
+                for lcr in request[2]] == ['0', '1', '2']
+
+        # Not drained again during the interval
+        for _ in range(5):
+            assert module.drain_spool() == 0
+        assert len(module.spool) == 7
+
+        module.spool_drained -= 60
+        assert module.drain_spool() == 3
+        assert len(module.spool) == 4
+        assert module.statsmgr.stats['backend-post.lcr-spool'] == 6
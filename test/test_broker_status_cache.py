@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest2
+
+from alignak.brok import Brok
+
+from alignak_module_backend.broker.module import STATUS_FIELDS
+
+from fakes import FakeBackend, get_module
+
+
+class TestBrokerStatusCache(unittest2.TestCase):
+
+    def test_01_cached_items(self):
+        """Only the status fields of the items are cached when the references are loaded
+
+        :return: None
+        """
+        module = get_module(status_cache='1')
+        for endpoint in ['host', 'service', 'user']:
+            assert sorted(module.items_cache[endpoint]) == sorted(FakeBackend.items[endpoint])
+            for item in module.items_cache[endpoint].values():
+                assert set(item) <= set(STATUS_FIELDS[endpoint] +
+                                        ['_id', '_etag', '_realm', 'name', 'host',
+                                         'ls_state', 'ls_state_type'])
+        assert 'ls_next_check' not in module.items_cache['host']['h0']
+        assert module.items_cache['host']['h0']['active_checks_enabled'] is True
+
+    def test_02_contact_status(self):
+        """The contact status updates use the cached user and its last _etag
+
+        :return: None
+        """
+        module = get_module(status_cache='1')
+        for index in range(4):
+            brok = Brok({'type': 'update_contact_status',
+                         'data': {'contact_name': 'admin',
+                                  'host_notifications_enabled': index % 2 == 1}})
+            assert module.manage_brok(brok) is True
+        assert len(FakeBackend.sent('PATCH', 'user/u1')) == 4
+        assert FakeBackend.sent('GET') == []
+        assert 'backend-conflict.user' not in module.statsmgr.stats
+        assert module.ref_live['user']['u1']['_etag'] == FakeBackend.items['user']['u1']['_etag']
+        assert FakeBackend.items['user']['u1']['host_notifications_enabled'] is True
+
+    def test_03_host_status(self):
+        """An host status update that is not cached gets the host status fields
+
+        :return: None
+        """
+        module = get_module(status_cache='1')
+        del module.items_cache['host']['h0']
+        brok = Brok({'type': 'update_host_status',
+                     'data': {'host_name': 'host0', 'active_checks_enabled': False}})
+        assert module.manage_brok(brok) is True
+        request = FakeBackend.sent('GET', 'host/h0')[0]
+        assert json.loads(request[2]['projection'])['active_checks_enabled'] == 1
+        assert FakeBackend.sent('PATCH', 'host/h0')[0][2] == {'active_checks_enabled': False}
+
+        # Cached now, nothing changed
+        assert module.manage_brok(brok) is False
+        assert len(FakeBackend.sent('GET')) == 1
+        assert len(FakeBackend.sent('PATCH')) == 1
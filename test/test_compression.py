@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest2
+
+from alignak.objects.module import Module
+
+from alignak_module_backend.compression import BodyCompression
+from alignak_module_backend.broker.metrics import Metrics
+
+from fakes import FakeBackend, FakeStats
+
+
+class TestCompression(unittest2.TestCase):
+
+    def setUp(self):
+        FakeBackend.populate(1, 0)
+        self.backend = FakeBackend('http://127.0.0.1:5000')
+        self.lcrs = [{'host_name': 'host0', 'output': 'Check output %d' % index}
+                     for index in range(100)]
+        self.size = len(json.dumps(self.lcrs).encode('utf-8'))
+
+    def test_01_not_compressed(self):
+        """The request bodies sizes are counted when the compression is disabled
+
+        :return: None
+        """
+        statsmgr = FakeStats()
+        metrics = Metrics()
+        compression = BodyCompression(Module({}), statsmgr, metrics)
+        response = compression.post(self.backend, 'logcheckresult', self.lcrs)
+        assert response['_status'] == 'OK'
+        assert FakeBackend.sent('POST', 'logcheckresult')[0][2] == self.lcrs
+        assert 'Content-Encoding' not in FakeBackend.sent('POST')[0][3]
+        assert statsmgr.stats['backend-bytes-raw.logcheckresult'] == self.size
+        assert statsmgr.stats['backend-bytes-wire.logcheckresult'] == self.size
+        assert metrics.get_stats()['http.post.logcheckresult']['count'] == 1
+
+        compression.put(self.backend, 'alignakretention/r1', {'host': 'host0'},
+                        {'If-Match': 'e'})
+        assert statsmgr.stats['backend-bytes-raw.alignakretention'] == \
+            statsmgr.stats['backend-bytes-wire.alignakretention']
+        assert metrics.get_stats()['http.put.alignakretention']['count'] == 1
+
+    def test_02_compressed(self):
+        """The big request bodies are compressed
+
+        :return: None
+        """
+        statsmgr = FakeStats()
+        metrics = Metrics()
+        compression = BodyCompression(Module({'compression': 'gzip'}), statsmgr, metrics)
+        compression.post(self.backend, 'logcheckresult', self.lcrs)
+        assert FakeBackend.sent('POST', 'logcheckresult')[0][2] == self.lcrs
+        assert FakeBackend.sent('POST')[0][3]['Content-Encoding'] == 'gzip'
+        assert statsmgr.stats['backend-bytes-raw.logcheckresult'] == self.size
+        assert statsmgr.stats['backend-bytes-wire.logcheckresult'] < self.size / 2
+        assert metrics.get_stats()['http.post.logcheckresult']['count'] == 1
+
+        # A small body is not compressed
+        compression.post(self.backend, 'logcheckresult', self.lcrs[:1])
+        assert 'Content-Encoding' not in FakeBackend.sent('POST')[1][3]
+
+        # No latency histograms
+        compression = BodyCompression(Module({'compression': 'deflate'}), statsmgr)
+        compression.post(self.backend, 'logcheckresult', self.lcrs)
+        assert FakeBackend.sent('POST')[2][3]['Content-Encoding'] == 'deflate'
+        assert FakeBackend.sent('POST', 'logcheckresult')[2][2] == self.lcrs
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import pstats
+import shutil
+import tempfile
+import unittest2
+
+from alignak.objects.module import Module
+
+from alignak_module_backend.profiler import Profiler
+
+
+class TestProfiler(unittest2.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_01_trigger_file(self):
+        """A profiling session is started by the trigger file
+
+        :return: None
+        """
+        trigger_file = os.path.join(self.folder, 'profile')
+        profiler = Profiler('backend_test', Module({
+            'profile_trigger_file': trigger_file,
+            'profile_duration': '1',
+            'profile_dir': self.folder
+        }))
+
+        # No trigger file, no profiling
+        profiler.check()
+        assert profiler.profile is None
+
+        open(trigger_file, 'w').close()
+        profiler.last_check = 0
+        profiler.check()
+        assert profiler.profile is not None
+        assert not os.path.exists(trigger_file)
+
+        start = time.time()
+        while time.time() - start < 1.5:
+            profiler.check()
+        assert profiler.profile is None
+
+        dumps = [filename for filename in os.listdir(self.folder)
+                 if filename.startswith('backend_test-') and filename.endswith('.pstats')]
+        assert len(dumps) == 1
+        stats = pstats.Stats(os.path.join(self.folder, dumps[0]))
+        assert stats.total_calls > 0
+
+    def test_02_request(self):
+        """A profiling session is started on request and stopped on demand
+
+        :return: None
+        """
+        profiler = Profiler('backend_test', Module({'profile_dir': self.folder}))
+        profiler.request()
+        profiler.check()
+        assert profiler.profile is not None
+
+        filename = profiler.stop()
+        assert os.path.exists(filename)
+        assert profiler.stop() is None
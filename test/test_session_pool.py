@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018: Alignak contrib team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak contrib projet.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+import unittest2
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+from alignak.objects.module import Module
+
+from alignak_module_backend.session import SessionPool
+
+from fakes import FakeStats
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP server request handler"""
+    protocol_version = 'HTTP/1.1'
+    connection_headers = []
+
+    def do_GET(self):
+        self.connection_headers.append(self.headers.get('Connection'))
+        body = json.dumps({'_status': 'OK'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server with a thread per connection"""
+    daemon_threads = True
+
+
+class FakeBackend(object):
+    """The backend client parts used by the connections pool"""
+    def __init__(self):
+        self.session = requests.Session()
+        self.timeout = None
+
+
+class TestSessionPool(unittest2.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/host' % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_01_shared_keepalive(self):
+        """The backend clients share the same keep-alive connections
+
+        :return: None
+        """
+        statsmgr = FakeStats()
+        pool = SessionPool(Module({'http_pool_size': '2', 'http_read_timeout': '5'}),
+                           statsmgr, workers=4)
+        assert pool.pool_size == 4
+        backends = [pool.attach(FakeBackend()) for _ in range(2)]
+        assert backends[0].timeout == (10.0, 5.0)
+
+        for _ in range(5):
+            for backend in backends:
+                backend.session.get(self.url, timeout=backend.timeout)
+
+        stats = pool.export()
+        assert stats['size'] == 4
+        assert stats['in-use'] == 0
+        assert stats['idle'] == 1
+        assert statsmgr.stats['http-pool.new-connections'] == 1
+        assert statsmgr.stats['http-pool.requests'] == 10
+
+        # Concurrent requests use several connections, kept in the pool
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda index: backends[index % 2].session.get(self.url),
+                              range(40)))
+        stats = pool.export()
+        assert 1 <= stats['idle'] <= 4
+        assert statsmgr.stats['http-pool.new-connections'] <= 4
+        assert statsmgr.stats['http-pool.requests'] == 50
+
+        # Forget the pooled connections
+        pool.clear()
+        backends[0].session.get(self.url)
+        pool.export()
+        assert statsmgr.stats['http-pool.new-connections'] <= 5
+        assert statsmgr.stats['http-pool.requests'] == 51
+
+    def test_02_no_keepalive(self):
+        """The connections are closed after each request when keep-alive is disabled
+
+        :return: None
+        """
+        statsmgr = FakeStats()
+        pool = SessionPool(Module({'http_keepalive': '0', 'http_connect_timeout': '0'}),
+                           statsmgr)
+        backend = pool.attach(FakeBackend())
+        assert backend.timeout == (None, None)
+
+        Handler.connection_headers = []
+        for _ in range(3):
+            backend.session.get(self.url)
+        assert Handler.connection_headers == ['close'] * 3
+        pool.export()
+        assert statsmgr.stats['http-pool.requests'] == 3